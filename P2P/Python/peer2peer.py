@@ -13,7 +13,9 @@ Vlastnosti:
 - Graceful shutdown
 """
 
+import os
 import socket
+import selectors
 import threading
 import logging
 import struct
@@ -30,6 +32,7 @@ MAX_PEERS = 50
 CONNECTION_TIMEOUT = 10.0
 MESSAGE_TIMEOUT = 60.0
 HEARTBEAT_INTERVAL = 30.0
+MAX_OUTBOUND = 1024 * 1024  # Strop odchozí fronty na peera (backpressure)
 
 # Nastavení logování
 logging.basicConfig(
@@ -39,15 +42,31 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Předkompilovaný formát délkového prefixu - bez parsování formátu na každou zprávu
+_HDR = struct.Struct('>I')
+
 # Globální stav
-connected_peers: Dict[Tuple[str, int], Tuple[socket.socket, str, float]] = {}  # address -> (socket, username, last_heartbeat)
-peers_lock = threading.Lock()
+# Připojení peery jako copy-on-write snímek: čtenáři (broadcast, /list,
+# heartbeat) si vezmou _peers_ref[0] a iterují bez zámku, zápisy
+# (connect/disconnect) vytvoří pod _writer_lock kopii a atomicky vymění
+# obsah slotu - přiřazení prvku listu je díky GIL atomické.
+_peers_ref: List[Dict[Tuple[str, int], Tuple[socket.socket, str, str]]] = [{}]  # address -> (socket, username, display)
+_writer_lock = threading.Lock()
+# Heartbeat časy oddělené od snímku - často zapisovaná data nepatří
+# do read-mostly struktury. Hodnota je jednoprvkový list (mutabilní slot):
+# horká cesta zapisuje slot[0] = čas bez zámku (přiřazení je pod GIL
+# atomické), _hb_lock chrání jen přidávání/odebírání klíčů.
+peer_heartbeats: Dict[Tuple[str, int], List[float]] = {}
+_hb_lock = threading.Lock()
 peer_running = threading.Event()
 peer_running.set()
-listener_socket: Optional[socket.socket] = None
-listener_thread: Optional[threading.Thread] = None
+reactor: Optional["Reactor"] = None
+reactor_thread: Optional[threading.Thread] = None
 username = "Peer"
 
+# Zámky pro odesílání podle file descriptoru - jeden zámek na socket,
+# aby broadcast mohl běžet paralelně přes více peerů
+_send_locks: Dict[int, threading.Lock] = {}
 
 def send_message(sock: socket.socket, message: str) -> bool:
     """
@@ -57,193 +76,675 @@ def send_message(sock: socket.socket, message: str) -> bool:
         sock: Socket pro odeslání
         message: Zpráva k odeslání
         
+    Returns:
+        True pokud úspěšné, False jinak
+    """
+    return _send_frame(sock, _frame(message))
+
+
+def _frame(message: str) -> bytes:
+    """
+    Sestaví kompletní rámec (délkový prefix + UTF-8 zpráva)
+
+    Args:
+        message: Zpráva k zarámování
+
+    Returns:
+        Rámec připravený k odeslání
+    """
+    payload = message.encode('utf-8')
+    return _HDR.pack(len(payload)) + payload
+
+
+def _send_frame(sock: socket.socket, framed: bytes) -> bool:
+    """
+    Odešle hotový rámec - broadcast tak kóduje i rámuje jen jednou
+
+    Args:
+        sock: Socket pro odeslání
+        framed: Rámec z _frame()
+
     Returns:
         True pokud úspěšné, False jinak
     """
     try:
-        message_bytes = message.encode('utf-8')
-        message_length = len(message_bytes)
-        
-        # Odeslání délky zprávy (4 byty, big-endian)
-        length_prefix = struct.pack('>I', message_length)
-        sock.sendall(length_prefix)
-        
-        # Odeslání samotné zprávy
-        sock.sendall(message_bytes)
+        # Sockety spravované reaktorem jsou neblokující - rámec se zařadí
+        # do odchozí fronty peera a odešle ho smyčka reaktoru. Pomalý
+        # peer tak nikdy neblokuje odesílatele.
+        r = reactor
+        if r is not None:
+            queued = r.queue_send(sock, framed)
+            if queued is not None:
+                return queued
+
+        # Socket mimo reaktor (např. během handshake) - blokující odeslání
+        # Zámek jen pro tento socket - souběžné odesílání různým peerům
+        # se navzájem neblokuje, ale rámce na jednom socketu se nemíchají
+        send_lock = _send_locks.setdefault(sock.fileno(), threading.Lock())
+        with send_lock:
+            # Celý rámec jedním sendall - jeden syscall a žádné zdržení
+            # prefixu v samostatném TCP segmentu
+            sock.sendall(framed)
         return True
     except Exception as e:
-        logger.error(f"Chyba při odesílání zprávy: {e}")
+        logger.error("Chyba při odesílání zprávy: %s", e)
         return False
 
 
+# Přijímací buffery podle file descriptoru - jeden buffer na socket,
+# aby se při každém recv nealokoval nový bytes objekt
+_recv_buffers: Dict[int, bytearray] = {}
+
+
 def receive_message(sock: socket.socket, timeout: float = MESSAGE_TIMEOUT) -> Optional[str]:
     """
     Přijme zprávu s prefixem délky
-    
+
     Args:
         sock: Socket pro přijetí
         timeout: Timeout v sekundách
-        
+
     Returns:
         Přijatá zpráva nebo None při chybě
     """
     try:
         sock.settimeout(timeout)
-        
-        # Přijetí délky zprávy (4 byty)
-        length_data = b''
-        while len(length_data) < 4:
-            chunk = sock.recv(4 - len(length_data))
-            if not chunk:
+
+        # Předalokovaný buffer pro tento socket (prefix + max. zpráva)
+        fd = sock.fileno()
+        buf = _recv_buffers.get(fd)
+        if buf is None:
+            buf = _recv_buffers[fd] = bytearray(4 + BUFFER_SIZE * 10)
+        mv = memoryview(buf)
+
+        # Přijetí délky zprávy (4 byty) přímo do bufferu
+        got = 0
+        while got < 4:
+            n = sock.recv_into(mv[got:4])
+            if not n:
                 return None
-            length_data += chunk
-        
-        message_length = struct.unpack('>I', length_data)[0]
-        
+            got += n
+
+        message_length = _HDR.unpack_from(mv)[0]
+
         # Validace délky zprávy
         if message_length > BUFFER_SIZE * 10:  # Max 40KB zpráva
-            logger.warning(f"Příliš dlouhá zpráva: {message_length} bytů")
+            logger.warning("Příliš dlouhá zpráva: %d bytů", message_length)
             return None
-        
-        # Přijetí samotné zprávy
-        message_data = b''
-        while len(message_data) < message_length:
-            chunk = sock.recv(min(message_length - len(message_data), BUFFER_SIZE))
-            if not chunk:
+
+        # Přijetí samotné zprávy do téhož bufferu (žádné spojování chunků)
+        end = 4 + message_length
+        got = 4
+        while got < end:
+            n = sock.recv_into(mv[got:end])
+            if not n:
                 return None
-            message_data += chunk
-        
-        return message_data.decode('utf-8')
-    
+            got += n
+
+        return bytes(mv[4:end]).decode('utf-8')
+
     except socket.timeout:
         return None
     except Exception as e:
-        logger.error(f"Chyba při přijímání zprávy: {e}")
+        logger.error("Chyba při přijímání zprávy: %s", e)
         return None
 
 
-def handle_incoming_peer(peer_socket: socket.socket, peer_address: Tuple[str, int]):
+# Cache zformátovaného seznamu peerů pro /list - seznam se mění jen při
+# connect/disconnect, čte se mnohem častěji
+_peer_list_cache: Optional[str] = None
+
+
+def _peers_snapshot() -> Dict[Tuple[str, int], Tuple[socket.socket, str, str]]:
     """
-    Obsluha příchozího peera
-    
-    Args:
-        peer_socket: Socket příchozího peera
-        peer_address: Adresa peera
+    Vrátí aktuální snímek připojených peerů (čtení bez zámku)
     """
-    peer_username = f"Peer_{peer_address[1]}"
-    
-    try:
-        peer_socket.settimeout(CONNECTION_TIMEOUT)
-        
-        # Přijetí uživatelského jména
-        welcome_msg = receive_message(peer_socket, timeout=10.0)
-        if welcome_msg and welcome_msg.startswith("USERNAME:"):
-            peer_username = welcome_msg.split(":", 1)[1].strip()[:20]
-            logger.info(f"Peer {peer_address} nastavil jméno: {peer_username}")
-        
-        # Přidání peera do seznamu
-        with peers_lock:
-            if len(connected_peers) >= MAX_PEERS:
-                send_message(peer_socket, "ERROR: Maximální počet peerů dosažen")
-                peer_socket.close()
-                return
-            
-            connected_peers[peer_address] = (peer_socket, peer_username, time.time())
-            logger.info(f"Peer připojen: {peer_username} ({peer_address}). Celkem peerů: {len(connected_peers)}")
-        
-        # Odeslání uvítací zprávy
-        send_message(peer_socket, f"Vítejte v P2P síti, {peer_username}! Jste připojeni k {username}.")
-        
-        # Hlavní smyčka pro komunikaci
-        while peer_running.is_set():
-            message = receive_message(peer_socket, timeout=HEARTBEAT_INTERVAL)
-            
-            if not message:
-                break
-            
-            # Aktualizace heartbeat
-            with peers_lock:
-                if peer_address in connected_peers:
-                    sock, uname, _ = connected_peers[peer_address]
-                    connected_peers[peer_address] = (sock, uname, time.time())
-            
-            # Speciální příkazy
-            if message.startswith("/"):
-                command = message.split()[0] if message.split() else message
-                
-                if command == "/quit":
-                    send_message(peer_socket, "Odpojování...")
-                    break
-                elif command == "/ping":
-                    send_message(peer_socket, "PONG")
-                elif command == "/list":
-                    with peers_lock:
-                        peer_list = ", ".join([f"{u} ({a[0]}:{a[1]})" for a, (_, u, _) in connected_peers.items()])
-                    send_message(peer_socket, f"Připojení peery: {peer_list}")
-                else:
-                    send_message(peer_socket, f"Echo: {message}")
-            else:
-                # Echo nebo zpracování zprávy
-                logger.info(f"Zpráva od {peer_username} ({peer_address}): {message}")
-                send_message(peer_socket, f"Echo: {message}")
-    
-    except Exception as e:
-        logger.error(f"Chyba při komunikaci s peerem {peer_address}: {e}", exc_info=True)
-    
-    finally:
-        # Odstranění peera ze seznamu
-        with peers_lock:
-            if peer_address in connected_peers:
-                del connected_peers[peer_address]
-                logger.info(f"Peer odpojen: {peer_username} ({peer_address}). Celkem peerů: {len(connected_peers)}")
-        
-        try:
-            peer_socket.close()
-        except:
-            pass
+    return _peers_ref[0]
 
 
-def listener_thread_func():
+def _format_peer_list() -> str:
     """
-    Vlákno pro naslouchání příchozím připojením
+    Vrátí zformátovaný seznam peerů; formátuje se jen po změně seznamu
     """
-    global listener_socket
-    
+    global _peer_list_cache
+    cached = _peer_list_cache
+    if cached is None:
+        cached = ", ".join(d for _, _, d in _peers_snapshot().values())
+        _peer_list_cache = cached
+    return cached
+
+
+def _add_peer(peer_address: Tuple[str, int], sock: socket.socket, peer_username: str):
+    """
+    Přidá peera do snímku (copy-on-write pod zámkem pro zapisovatele)
+    """
+    global _peer_list_cache
+    # Internované jméno sdílí jeden str objekt napříč porovnáními
+    # a formátováním; zobrazovací řetězec pro /list se skládá jen jednou
+    peer_username = sys.intern(peer_username)
+    display = f"{peer_username} ({peer_address[0]}:{peer_address[1]})"
+    with _writer_lock:
+        new_peers = dict(_peers_ref[0])
+        new_peers[peer_address] = (sock, peer_username, display)
+        _peers_ref[0] = new_peers
+    _peer_list_cache = None
+    with _hb_lock:
+        peer_heartbeats[peer_address] = [time.monotonic()]
+
+
+def _remove_peer(peer_address: Tuple[str, int]) -> bool:
+    """
+    Odstraní peera ze snímku
+
+    Returns:
+        True pokud peer existoval, False jinak
+    """
+    global _peer_list_cache
+    removed = False
+    with _writer_lock:
+        if peer_address in _peers_ref[0]:
+            new_peers = dict(_peers_ref[0])
+            del new_peers[peer_address]
+            _peers_ref[0] = new_peers
+            removed = True
+    if removed:
+        _peer_list_cache = None
+    with _hb_lock:
+        peer_heartbeats.pop(peer_address, None)
+    return removed
+
+
+def _mark_dead(peer_address: Tuple[str, int]):
+    """
+    Označí peera jako mrtvého jediným zápisem bez zámku
+
+    Posune heartbeat slot za hranici timeoutu, takže příští běh
+    cleanup_disconnected_peers peera odstraní a uzavře jeho socket.
+    Volající tak nemusí brát zapisovací zámek registru.
+    """
+    slot = peer_heartbeats.get(peer_address)
+    if slot is not None:
+        slot[0] = time.monotonic() - HEARTBEAT_INTERVAL * 4
+
+
+def _close_peer_socket(sock: socket.socket):
+    """
+    Uzavře socket peera; spravovaný socket odregistruje vlákno reaktoru
+
+    Běží na úklidovém i hlavním vlákně (/disconnect), takže na selector
+    nesmí sahat přímo - odregistrování a close předá reaktoru přes
+    self-pipe. Socket mimo reaktor (nebo po jeho ukončení) se zavře
+    rovnou.
+    """
+    r = reactor
+    if r is not None and r.request_close(sock):
+        return
     try:
-        listener_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        listener_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        listener_socket.bind((DEFAULT_HOST, DEFAULT_PORT))
-        listener_socket.listen(MAX_PEERS)
-        
-        logger.info(f"P2P listener naslouchá na {DEFAULT_HOST}:{DEFAULT_PORT}")
-        
-        while peer_running.is_set():
+        sock.close()
+    except:
+        pass
+
+
+def _create_listener_socket(host: str, port: int, backlog: int = MAX_PEERS) -> socket.socket:
+    """
+    Vytvoří naslouchací socket se SO_REUSEADDR a (kde je k dispozici)
+    SO_REUSEPORT, takže na stejném portu může naslouchat více reaktorů
+    či procesů a kernel mezi ně rozkládá příchozí spojení
+
+    Args:
+        host: Adresa pro bind
+        port: Port pro bind
+        backlog: Délka fronty pro listen
+
+    Returns:
+        Nablokovaný naslouchací socket
+    """
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if hasattr(socket, 'SO_REUSEPORT'):  # Linux 3.9+, BSD; Windows nemá
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    listener.bind((host, port))
+    listener.listen(backlog)
+    listener.setblocking(False)
+    return listener
+
+
+class Reactor:
+    """
+    Jednoduchý reaktor nad selectors.DefaultSelector (epoll na Linuxu,
+    kqueue na BSD). Jedno vlákno multiplexuje naslouchací socket i všechny
+    příchozí peer sockety, takže odpadá vlákno (a context switche) na peera.
+
+    Každé spojení má malý stavový automat pro parsování rámců:
+    {'phase': 'len'|'body', 'need': int, 'buf': bytearray}, takže částečné
+    čtení nikdy neblokuje ostatní peery.
+    """
+
+    # Sentinel pro self-pipe, kterým stop() budí blokující select()
+    _WAKEUP = object()
+
+    def __init__(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT):
+        self.host = host
+        self.port = port
+        self.selector = selectors.DefaultSelector()
+        self.listener: Optional[socket.socket] = None
+        self._wakeup_r, self._wakeup_w = os.pipe()
+        # Spojení podle file descriptoru - queue_send přes něj najde
+        # odchozí frontu peera
+        self._conns: Dict[int, dict] = {}
+        # Fd, kterým má smyčka po probuzení zapnout EVENT_WRITE;
+        # selector.modify smí volat jen vlákno reaktoru
+        self._write_pending: List[int] = []
+        # Fd, která má smyčka po probuzení odregistrovat a zavřít;
+        # selector.unregister platí stejné pravidlo jako pro modify
+        self._close_pending: List[int] = []
+        self._pending_lock = threading.Lock()
+
+    def start(self):
+        """
+        Vytvoří naslouchací socket a zaregistruje ho do selektoru
+        """
+        self.listener = _create_listener_socket(self.host, self.port)
+
+        # data=None označuje naslouchací socket
+        self.selector.register(self.listener, selectors.EVENT_READ, data=None)
+        self.selector.register(self._wakeup_r, selectors.EVENT_READ, data=self._WAKEUP)
+        logger.info("P2P listener naslouchá na %s:%d", self.host, self.port)
+
+    def run(self):
+        """
+        Hlavní smyčka reaktoru - dispatch událostí z jednoho vlákna.
+        select() blokuje bez periodického buzení; ukončení signalizuje
+        stop() zápisem do self-pipe.
+        """
+        try:
+            while peer_running.is_set():
+                events = self.selector.select()
+                for key, mask in events:
+                    if key.data is None:
+                        self._accept()
+                    elif key.data is self._WAKEUP:
+                        os.read(self._wakeup_r, 4096)
+                        self._flush_pending()
+                    else:
+                        conn = key.data
+                        if mask & selectors.EVENT_READ:
+                            self._read(conn)
+                        if mask & selectors.EVENT_WRITE and not conn.get('dead'):
+                            self._write(conn)
+        except Exception as e:
+            logger.error("Kritická chyba reaktoru: %s", e, exc_info=True)
+        finally:
+            self._close_all()
+
+    def stop(self):
+        """
+        Probudí blokující select(); úklid provede smyčka reaktoru sama
+        """
+        try:
+            os.write(self._wakeup_w, b'\0')
+        except OSError:
+            pass
+
+    def _close_all(self):
+        """
+        Uzavření listeneru, self-pipe a selektoru
+        """
+        if self.listener:
             try:
-                listener_socket.settimeout(1.0)  # Krátký timeout pro kontrolu peer_running
-                peer_socket, peer_address = listener_socket.accept()
-                
-                logger.info(f"Nové připojení od peera: {peer_address}")
-                
-                # Vytvoření vlákna pro obsluhu peera
-                thread = threading.Thread(
-                    target=handle_incoming_peer,
-                    args=(peer_socket, peer_address),
-                    daemon=True,
-                    name=f"PeerHandler-{peer_address[1]}"
-                )
-                thread.start()
-                
-            except socket.timeout:
-                continue
+                self.selector.unregister(self.listener)
+            except (KeyError, ValueError):
+                pass
+            try:
+                self.listener.close()
+            except:
+                pass
+        for fd in (self._wakeup_r, self._wakeup_w):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        try:
+            self.selector.close()
+        except:
+            pass
+
+    def _accept(self):
+        """
+        Přijme všechna čekající připojení (až do EAGAIN)
+        """
+        while True:
+            try:
+                peer_socket, peer_address = self.listener.accept()
+            except BlockingIOError:
+                break
             except OSError:
                 if peer_running.is_set():
                     logger.error("Chyba při přijímání peera")
                 break
-            except Exception as e:
-                logger.error(f"Neočekávaná chyba v listeneru: {e}", exc_info=True)
-    
-    except Exception as e:
-        logger.error(f"Kritická chyba listeneru: {e}", exc_info=True)
+
+            logger.info("Nové připojení od peera: %s", peer_address)
+
+            # Vypnutí Nagleova algoritmu - interaktivní zprávy jsou malé
+            peer_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            peer_socket.setblocking(False)
+
+            # Stavový automat pro parsování rámců; username se nastaví
+            # až po handshake zprávě USERNAME:
+            conn = {
+                'sock': peer_socket,
+                'addr': peer_address,
+                'phase': 'len',
+                'need': 4,
+                'buf': bytearray(),
+                'username': None,
+                'out': bytearray(),
+                'out_off': 0,
+            }
+            self._conns[peer_socket.fileno()] = conn
+            self.selector.register(peer_socket, selectors.EVENT_READ, data=conn)
+
+    def register_outgoing(self, sock: socket.socket, peer_address: Tuple[str, int], peer_username: str):
+        """
+        Zaregistruje odchozí spojení - příjem obsluhuje reaktor,
+        žádné vlákno na peera
+
+        Args:
+            sock: Socket odchozího spojení (po handshake)
+            peer_address: Adresa peera
+            peer_username: Jméno peera
+        """
+        sock.setblocking(False)
+        conn = {
+            'sock': sock,
+            'addr': peer_address,
+            'phase': 'len',
+            'need': 4,
+            'buf': bytearray(),
+            'username': peer_username,
+            'outgoing': True,
+            'out': bytearray(),
+            'out_off': 0,
+        }
+        self._conns[sock.fileno()] = conn
+        self.selector.register(sock, selectors.EVENT_READ, data=conn)
+
+    def queue_send(self, sock: socket.socket, framed: bytes) -> Optional[bool]:
+        """
+        Zařadí rámec do odchozí fronty peera (neblokující odeslání)
+
+        Args:
+            sock: Socket peera
+            framed: Rámec z _frame()
+
+        Returns:
+            True pokud zařazeno, False při přeplněné frontě,
+            None pokud socket reaktor nespravuje
+        """
+        fd = sock.fileno()
+        conn = self._conns.get(fd)
+        if conn is None:
+            return None
+
+        send_lock = _send_locks.setdefault(fd, threading.Lock())
+        with send_lock:
+            if conn.get('dead'):
+                return False
+            conn['out'] += framed
+            backlog = len(conn['out']) - conn['out_off']
+
+        # Probuzení smyčky, aby pro tento socket zapnula EVENT_WRITE
+        with self._pending_lock:
+            self._write_pending.append(fd)
+        try:
+            os.write(self._wakeup_w, b'\0')
+        except OSError:
+            pass
+
+        # Backpressure: peera neschopného odebírat data odpojí smyčka
+        return backlog <= MAX_OUTBOUND
+
+    def request_close(self, sock: socket.socket) -> bool:
+        """
+        Požádá vlákno reaktoru o odregistrování a uzavření socketu
+
+        Selector není thread-safe - unregister z cizího vlákna by se
+        křížil s běžícím select(). Úklid proto provede smyčka reaktoru
+        po probuzení self-pipe, stejně jako zapínání EVENT_WRITE.
+
+        Args:
+            sock: Socket peera
+
+        Returns:
+            True pokud úklid převzal reaktor, False pokud socket
+            nespravuje (volající ho má zavřít sám)
+        """
+        if not peer_running.is_set():
+            return False
+        try:
+            fd = sock.fileno()
+        except OSError:
+            return False
+        conn = self._conns.get(fd)
+        if conn is None or conn.get('dead'):
+            return False
+        with self._pending_lock:
+            self._close_pending.append(fd)
+        try:
+            os.write(self._wakeup_w, b'\0')
+        except OSError:
+            return False
+        return True
+
+    def _flush_pending(self):
+        """
+        Zapne EVENT_WRITE socketům s daty ve frontě; přeplněné odpojí.
+        Odregistruje sockety nahlášené přes request_close.
+        Běží výhradně ve vlákně reaktoru.
+        """
+        with self._pending_lock:
+            pending, self._write_pending = self._write_pending, []
+            closing, self._close_pending = self._close_pending, []
+
+        for fd in closing:
+            conn = self._conns.get(fd)
+            if conn is not None and not conn.get('dead'):
+                self._drop(conn)
+
+        for fd in pending:
+            conn = self._conns.get(fd)
+            if conn is None or conn.get('dead'):
+                continue
+            backlog = len(conn['out']) - conn['out_off']
+            if backlog > MAX_OUTBOUND:
+                logger.warning("Peer %s neodebírá data (%d bytů ve frontě) - odpojuji", conn['addr'], backlog)
+                self._drop(conn)
+            elif backlog > 0:
+                self.selector.modify(conn['sock'], selectors.EVENT_READ | selectors.EVENT_WRITE, conn)
+
+    def _write(self, conn: dict):
+        """
+        Odešle, co kernel zrovna pobere, a posune offset fronty.
+        Po vyprázdnění fronty vrátí socket na čisté EVENT_READ.
+        """
+        sock = conn['sock']
+        send_lock = _send_locks.setdefault(sock.fileno(), threading.Lock())
+        with send_lock:
+            mv = memoryview(conn['out'])[conn['out_off']:]
+            try:
+                n = sock.send(mv)
+            except BlockingIOError:
+                return
+            except OSError as e:
+                logger.error("Chyba při odesílání k peeru %s: %s", conn['addr'], e)
+                mv.release()
+                self._drop(conn)
+                return
+            finally:
+                # memoryview musí zaniknout, jinak by queue_send nemohl
+                # bytearray zvětšit (BufferError)
+                mv.release()
+
+            conn['out_off'] += n
+            if conn['out_off'] >= len(conn['out']):
+                conn['out'] = bytearray()
+                conn['out_off'] = 0
+                self.selector.modify(sock, selectors.EVENT_READ, conn)
+
+    def _read(self, conn: dict):
+        """
+        Přečte dostupná data jednoho peera a dokončené rámce předá dál
+
+        Args:
+            conn: Stav spojení (socket, fáze parsování, buffer)
+        """
+        sock = conn['sock']
+        try:
+            chunk = sock.recv(conn['need'] - len(conn['buf']))
+        except BlockingIOError:
+            return
+        except OSError as e:
+            logger.error("Chyba při přijímání od peera %s: %s", conn['addr'], e)
+            self._drop(conn)
+            return
+
+        if not chunk:
+            # Peer uzavřel spojení
+            self._drop(conn)
+            return
+
+        conn['buf'] += chunk
+        if len(conn['buf']) < conn['need']:
+            return  # Částečné čtení - počkáme na další data
+
+        if conn['phase'] == 'len':
+            message_length = _HDR.unpack_from(conn['buf'])[0]
+
+            # Validace délky zprávy
+            if message_length > BUFFER_SIZE * 10:  # Max 40KB zpráva
+                logger.warning("Příliš dlouhá zpráva: %d bytů", message_length)
+                self._drop(conn)
+                return
+
+            conn['phase'] = 'body'
+            conn['need'] = message_length
+            conn['buf'] = bytearray()
+        else:
+            try:
+                message = bytes(conn['buf']).decode('utf-8')
+            except UnicodeDecodeError as e:
+                logger.error("Neplatné kódování zprávy od %s: %s", conn['addr'], e)
+                self._drop(conn)
+                return
+
+            conn['phase'] = 'len'
+            conn['need'] = 4
+            conn['buf'] = bytearray()
+            self._on_message(conn, message)
+
+    def _on_message(self, conn: dict, message: str):
+        """
+        Zpracování jednoho kompletního rámce od peera
+        """
+        sock = conn['sock']
+        peer_address = conn['addr']
+
+        # První zpráva je handshake s uživatelským jménem
+        if conn['username'] is None:
+            peer_username = f"Peer_{peer_address[1]}"
+            if message.startswith("USERNAME:"):
+                peer_username = message.split(":", 1)[1].strip()[:20]
+                logger.info("Peer %s nastavil jméno: %s", peer_address, peer_username)
+
+            # Přidání peera do seznamu
+            if len(_peers_snapshot()) >= MAX_PEERS:
+                send_message(sock, "ERROR: Maximální počet peerů dosažen")
+                self._drop(conn)
+                return
+
+            _add_peer(peer_address, sock, peer_username)
+            logger.info("Peer připojen: %s (%s). Celkem peerů: %d", peer_username, peer_address, len(_peers_snapshot()))
+
+            conn['username'] = peer_username
+
+            # Odeslání uvítací zprávy
+            send_message(sock, f"Vítejte v P2P síti, {peer_username}! Jste připojeni k {username}.")
+            return
+
+        # Aktualizace heartbeat - zápis do slotu úplně bez zámku
+        hb_slot = peer_heartbeats.get(peer_address)
+        if hb_slot is not None:
+            hb_slot[0] = time.monotonic()
+
+        # Zprávy od peera, ke kterému jsme se sami připojili, jen zobrazíme
+        if conn.get('outgoing'):
+            print(f"\n[{peer_address[0]}:{peer_address[1]}] {message}")
+            print("> ", end="", flush=True)
+            return
+
+        # Speciální příkazy
+        if message.startswith("/"):
+            command = message.split()[0] if message.split() else message
+
+            if command == "/quit":
+                send_message(sock, "Odpojování...")
+                self._drop(conn)
+            elif command == "/ping":
+                send_message(sock, "PONG")
+            elif command == "/list":
+                send_message(sock, f"Připojení peery: {_format_peer_list()}")
+            else:
+                send_message(sock, f"Echo: {message}")
+        else:
+            # Echo nebo zpracování zprávy
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("Zpráva od %s (%s): %s", conn['username'], peer_address, message)
+            send_message(sock, f"Echo: {message}")
+
+    def _drop(self, conn: dict):
+        """
+        Odregistrování a uzavření spojení peera
+        """
+        sock = conn['sock']
+        peer_address = conn['addr']
+
+        conn['dead'] = True
+        try:
+            fd = sock.fileno()
+        except OSError:
+            fd = -1
+        self._conns.pop(fd, None)
+
+        try:
+            self.selector.unregister(sock)
+        except (KeyError, ValueError):
+            pass
+
+        # Best-effort doručení zbytku odchozí fronty - odpovědi řazené
+        # těsně před _drop ("Odpojování..." na /quit, ERROR při plném
+        # registru) by se jinak zavřením socketu ztratily. Krátký
+        # timeout, ať úklid nevisí na peerovi, který nečte
+        if fd >= 0:
+            send_lock = _send_locks.setdefault(fd, threading.Lock())
+            with send_lock:
+                remaining = bytes(conn['out'][conn['out_off']:])
+                conn['out'] = bytearray()
+                conn['out_off'] = 0
+            if remaining:
+                try:
+                    sock.settimeout(0.5)
+                    sock.sendall(remaining)
+                except OSError:
+                    pass
+
+        # Odstranění peera ze seznamu
+        if _remove_peer(peer_address):
+            logger.info("Peer odpojen: %s (%s). Celkem peerů: %d", conn['username'], peer_address, len(_peers_snapshot()))
+
+        try:
+            sock.close()
+        except:
+            pass
 
 
 def connect_to_peer(host: str, port: int) -> bool:
@@ -259,17 +760,19 @@ def connect_to_peer(host: str, port: int) -> bool:
     """
     peer_address = (host, port)
     
-    # Kontrola, zda už není připojen
-    with peers_lock:
-        if peer_address in connected_peers:
-            print(f"Již jste připojeni k {host}:{port}")
-            return False
+    # Kontrola, zda už není připojen (čtení snímku bez zámku)
+    if peer_address in _peers_snapshot():
+        print(f"Již jste připojeni k {host}:{port}")
+        return False
     
     try:
         print(f"Připojování k peeru {host}:{port}...")
         peer_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         peer_socket.settimeout(CONNECTION_TIMEOUT)
         peer_socket.connect((host, port))
+
+        # Vypnutí Nagleova algoritmu - interaktivní zprávy jsou malé
+        peer_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
         
         # Odeslání uživatelského jména
         send_message(peer_socket, f"USERNAME:{username}")
@@ -280,34 +783,14 @@ def connect_to_peer(host: str, port: int) -> bool:
             print(f"✓ {welcome}")
         
         # Přidání do seznamu
-        with peers_lock:
-            connected_peers[peer_address] = (peer_socket, f"Peer_{port}", time.time())
-            logger.info(f"Připojeno k peeru {host}:{port}. Celkem peerů: {len(connected_peers)}")
-        
-        # Spuštění vlákna pro přijímání zpráv od tohoto peera
-        def receive_from_peer():
-            while peer_running.is_set():
-                try:
-                    message = receive_message(peer_socket, timeout=1.0)
-                    if message:
-                        print(f"\n[{host}:{port}] {message}")
-                        print("> ", end="", flush=True)
-                    elif message is None:
-                        break
-                except:
-                    if peer_running.is_set():
-                        continue
-                    break
-            
-            # Odstranění při odpojení
-            with peers_lock:
-                if peer_address in connected_peers:
-                    del connected_peers[peer_address]
-                    logger.info(f"Odpojeno od peera {host}:{port}")
-        
-        thread = threading.Thread(target=receive_from_peer, daemon=True)
-        thread.start()
+        _add_peer(peer_address, peer_socket, f"Peer_{port}")
+        logger.info("Připojeno k peeru %s:%d. Celkem peerů: %d", host, port, len(_peers_snapshot()))
         
+        # Příjem od tohoto peera obsluhuje reaktor - žádné další vlákno
+        peer_socket.settimeout(None)
+        if reactor is not None:
+            reactor.register_outgoing(peer_socket, peer_address, f"Peer_{port}")
+
         return True
     
     except ConnectionRefusedError:
@@ -318,7 +801,7 @@ def connect_to_peer(host: str, port: int) -> bool:
         return False
     except Exception as e:
         print(f"Chyba při připojování: {e}")
-        logger.error(f"Chyba při připojování k {host}:{port}: {e}")
+        logger.error("Chyba při připojování k %s:%d: %s", host, port, e)
         return False
 
 
@@ -333,13 +816,12 @@ def send_to_peer(peer_address: Tuple[str, int], message: str) -> bool:
     Returns:
         True pokud úspěšné, False jinak
     """
-    with peers_lock:
-        if peer_address not in connected_peers:
-            print(f"Nejste připojeni k {peer_address[0]}:{peer_address[1]}")
-            return False
-        
-        peer_socket, _, _ = connected_peers[peer_address]
-    
+    peer = _peers_snapshot().get(peer_address)
+    if peer is None:
+        print(f"Nejste připojeni k {peer_address[0]}:{peer_address[1]}")
+        return False
+
+    peer_socket, _, _ = peer
     return send_message(peer_socket, message)
 
 
@@ -355,57 +837,196 @@ def broadcast_to_all_peers(message: str) -> int:
     """
     sent_count = 0
     disconnected_peers = []
-    
-    with peers_lock:
-        peers_copy = list(connected_peers.items())
-    
-    for peer_address, (peer_socket, peer_username, _) in peers_copy:
+
+    # Rámec se sestaví jen jednou, všichni příjemci dostanou tytéž byty
+    framed = _frame(message)
+
+    # Snímek bez zámku - broadcast nikdy nedrží zapisovatele.
+    # _send_frame je u spravovaných socketů jen zařazení do odchozí
+    # fronty reaktoru, takže pomalý peer odesílatele nezdržuje a fan-out
+    # nepotřebuje žádný pool vláken
+    for peer_address, (peer_socket, _, _) in _peers_snapshot().items():
         try:
-            if send_message(peer_socket, message):
+            if _send_frame(peer_socket, framed):
                 sent_count += 1
             else:
                 disconnected_peers.append(peer_address)
         except Exception as e:
-            logger.error(f"Chyba při broadcastu k {peer_address}: {e}")
+            logger.error("Chyba při broadcastu k %s: %s", peer_address, e)
             disconnected_peers.append(peer_address)
-    
-    # Odstranění odpojených peerů
-    with peers_lock:
-        for peer_address in disconnected_peers:
-            if peer_address in connected_peers:
-                del connected_peers[peer_address]
-    
+
+    # Odpojené peery jen označíme - skutečné odstranění (a zámek
+    # registru) nechá broadcast na sweeperu cleanup_disconnected_peers
+    for peer_address in disconnected_peers:
+        _mark_dead(peer_address)
+
     return sent_count
 
 
 def cleanup_disconnected_peers():
     """
     Vyčištění neaktivních peerů (heartbeat check)
+
+    Regulérní uzavření socketu zachytí reaktor událostně (EOF při čtení)
+    a peera odstraní okamžitě přes _drop. Tento sweep je jen záchytná
+    síť pro polootevřená spojení bez heartbeatu a pro peery označené
+    přes _mark_dead.
     """
-    current_time = time.time()
-    disconnected = []
-    
-    with peers_lock:
-        for peer_address, (peer_socket, peer_username, last_heartbeat) in list(connected_peers.items()):
-            if current_time - last_heartbeat > HEARTBEAT_INTERVAL * 3:
-                disconnected.append(peer_address)
-        
-        for peer_address in disconnected:
-            if peer_address in connected_peers:
-                sock, _, _ = connected_peers[peer_address]
-                try:
-                    sock.close()
-                except:
-                    pass
-                del connected_peers[peer_address]
-                logger.info(f"Peer {peer_address} odstraněn kvůli neaktivitě")
+    current_time = time.monotonic()
+
+    with _hb_lock:
+        heartbeats = {addr: slot[0] for addr, slot in peer_heartbeats.items()}
+
+    snapshot = _peers_snapshot()
+    for peer_address, last_heartbeat in heartbeats.items():
+        if current_time - last_heartbeat > HEARTBEAT_INTERVAL * 3:
+            peer = snapshot.get(peer_address)
+            if peer is not None:
+                _close_peer_socket(peer[0])
+            if _remove_peer(peer_address):
+                logger.info("Peer %s odstraněn kvůli neaktivitě", peer_address)
+
+
+def _cmd_quit(parts: List[str]) -> bool:
+    """
+    Ukončení aplikace
+    """
+    print("Ukončování...")
+    return False
+
+
+def _cmd_connect(parts: List[str]) -> bool:
+    """
+    Příkaz /connect <host> <port>
+    """
+    if len(parts) < 3:
+        print("Použití: /connect <host> <port>")
+        return True
+    try:
+        connect_to_peer(parts[1], int(parts[2]))
+    except ValueError:
+        print("Chyba: Neplatný port")
+    except Exception as e:
+        print(f"Chyba: {e}")
+    return True
+
+
+def _cmd_list(parts: List[str]) -> bool:
+    """
+    Příkaz /list - výpis připojených peerů
+    """
+    snapshot = _peers_snapshot()
+    if snapshot:
+        print("\nPřipojení peery:")
+        for peer_address, (_, _, peer_display) in snapshot.items():
+            hb_slot = peer_heartbeats.get(peer_address)
+            last_hb = hb_slot[0] if hb_slot else 0.0
+            time_ago = time.monotonic() - last_hb
+            print(f"  - {peer_display} - aktivní před {int(time_ago)}s")
+    else:
+        print("Žádní připojení peery")
+    print()
+    return True
+
+
+def _cmd_send(parts: List[str]) -> bool:
+    """
+    Příkaz /send <host> <port> <msg>
+    """
+    if len(parts) < 4:
+        print("Použití: /send <host> <port> <msg>")
+        return True
+    try:
+        host = parts[1]
+        port = int(parts[2])
+        message = " ".join(parts[3:])
+        if send_to_peer((host, port), message):
+            print(f"Zpráva odeslána k {host}:{port}")
+        else:
+            print(f"Chyba: Nelze odeslat zprávu")
+    except ValueError:
+        print("Chyba: Neplatný port")
+    return True
+
+
+def _cmd_broadcast(parts: List[str]) -> bool:
+    """
+    Příkaz /broadcast <msg>
+    """
+    if len(parts) < 2:
+        print("Použití: /broadcast <msg>")
+        return True
+    message = " ".join(parts[1:])
+    count = broadcast_to_all_peers(message)
+    print(f"Zpráva odeslána {count} peerům")
+    return True
+
+
+def _cmd_disconnect(parts: List[str]) -> bool:
+    """
+    Příkaz /disconnect <host> <port>
+    """
+    if len(parts) < 3:
+        print("Použití: /disconnect <host> <port>")
+        return True
+    try:
+        host = parts[1]
+        port = int(parts[2])
+        peer_address = (host, port)
+        peer = _peers_snapshot().get(peer_address)
+        if peer is not None:
+            sock, _, _ = peer
+            send_message(sock, "/quit")
+            _close_peer_socket(sock)
+            _remove_peer(peer_address)
+            print(f"Odpojeno od {host}:{port}")
+        else:
+            print(f"Nejste připojeni k {host}:{port}")
+    except ValueError:
+        print("Chyba: Neplatný port")
+    return True
+
+
+def _cmd_help(parts: List[str]) -> bool:
+    """
+    Příkaz /help - výpis nápovědy
+    """
+    print("""
+Dostupné příkazy:
+  /connect <host> <port>     - Připojení k peeru
+  /list                      - Seznam připojených peerů
+  /send <host> <port> <msg>  - Odeslání zprávy konkrétnímu peeru
+  /broadcast <msg>           - Odeslání zprávy všem peerům
+  /disconnect <host> <port>  - Odpojení od peera
+  /help                      - Zobrazení této nápovědy
+  /quit                      - Ukončení aplikace
+
+Příklad použití:
+  /connect 127.0.0.1 8081    - Připojení k peeru na localhost:8081
+  /send 127.0.0.1 8081 Ahoj  - Odeslání zprávy "Ahoj"
+  /broadcast Hello everyone  - Odeslání všem
+                    """)
+    return True
+
+
+# Dispatch tabulka příkazů - O(1) lookup místo řetězce if/elif porovnání
+COMMAND_HANDLERS = {
+    "/quit": _cmd_quit,
+    "quit": _cmd_quit,
+    "/connect": _cmd_connect,
+    "/list": _cmd_list,
+    "/send": _cmd_send,
+    "/broadcast": _cmd_broadcast,
+    "/disconnect": _cmd_disconnect,
+    "/help": _cmd_help,
+}
 
 
 def main():
     """
     Hlavní funkce P2P aplikace
     """
-    global username, listener_thread
+    global username, reactor, reactor_thread
     
     logger.info("=" * 60)
     logger.info("Spouštění P2P aplikace")
@@ -416,12 +1037,11 @@ def main():
     if username_input:
         username = username_input[:20]
     
-    # Spuštění listeneru
-    listener_thread = threading.Thread(target=listener_thread_func, daemon=True)
-    listener_thread.start()
-    
-    # Počkat na spuštění listeneru
-    time.sleep(0.5)
+    # Spuštění reaktoru (listener + všichni příchozí peery v jednom vlákně)
+    reactor = Reactor()
+    reactor.start()
+    reactor_thread = threading.Thread(target=reactor.run, daemon=True, name="Reactor")
+    reactor_thread.start()
     
     print("\n" + "=" * 60)
     print("P2P Aplikace")
@@ -438,7 +1058,8 @@ def main():
     print("  /quit                  - Ukončení aplikace")
     print("=" * 60 + "\n")
     
-    # Vlákno pro cleanup
+    # Záchytný sweep pro polootevřená spojení - běžné odpojení zachytí
+    # reaktor událostně, takže tady stačí řídký heartbeat timer
     def cleanup_thread():
         while peer_running.is_set():
             time.sleep(HEARTBEAT_INTERVAL)
@@ -456,85 +1077,15 @@ def main():
                 if not command:
                     continue
                 
+                # Vstup rozdělíme jen jednou a příkaz vyhledáme v dispatch tabulce
                 parts = command.split()
                 cmd = parts[0] if parts else command
-                
-                if cmd == "/quit" or cmd == "quit":
-                    print("Ukončování...")
-                    break
-                
-                elif cmd == "/connect" and len(parts) >= 3:
-                    try:
-                        host = parts[1]
-                        port = int(parts[2])
-                        connect_to_peer(host, port)
-                    except ValueError:
-                        print("Chyba: Neplatný port")
-                    except Exception as e:
-                        print(f"Chyba: {e}")
-                
-                elif cmd == "/list":
-                    with peers_lock:
-                        if connected_peers:
-                            print("\nPřipojení peery:")
-                            for (host, port), (_, peer_username, last_hb) in connected_peers.items():
-                                time_ago = time.time() - last_hb
-                                print(f"  - {peer_username} ({host}:{port}) - aktivní před {int(time_ago)}s")
-                        else:
-                            print("Žádní připojení peery")
-                        print()
-                
-                elif cmd == "/send" and len(parts) >= 4:
-                    try:
-                        host = parts[1]
-                        port = int(parts[2])
-                        message = " ".join(parts[3:])
-                        if send_to_peer((host, port), message):
-                            print(f"Zpráva odeslána k {host}:{port}")
-                        else:
-                            print(f"Chyba: Nelze odeslat zprávu")
-                    except ValueError:
-                        print("Chyba: Neplatný port")
-                
-                elif cmd == "/broadcast" and len(parts) >= 2:
-                    message = " ".join(parts[1:])
-                    count = broadcast_to_all_peers(message)
-                    print(f"Zpráva odeslána {count} peerům")
-                
-                elif cmd == "/disconnect" and len(parts) >= 3:
-                    try:
-                        host = parts[1]
-                        port = int(parts[2])
-                        peer_address = (host, port)
-                        with peers_lock:
-                            if peer_address in connected_peers:
-                                sock, _, _ = connected_peers[peer_address]
-                                send_message(sock, "/quit")
-                                sock.close()
-                                del connected_peers[peer_address]
-                                print(f"Odpojeno od {host}:{port}")
-                            else:
-                                print(f"Nejste připojeni k {host}:{port}")
-                    except ValueError:
-                        print("Chyba: Neplatný port")
-                
-                elif cmd == "/help":
-                    print("""
-Dostupné příkazy:
-  /connect <host> <port>     - Připojení k peeru
-  /list                      - Seznam připojených peerů
-  /send <host> <port> <msg>  - Odeslání zprávy konkrétnímu peeru
-  /broadcast <msg>           - Odeslání zprávy všem peerům
-  /disconnect <host> <port>  - Odpojení od peera
-  /help                      - Zobrazení této nápovědy
-  /quit                      - Ukončení aplikace
 
-Příklad použití:
-  /connect 127.0.0.1 8081    - Připojení k peeru na localhost:8081
-  /send 127.0.0.1 8081 Ahoj  - Odeslání zprávy "Ahoj"
-  /broadcast Hello everyone  - Odeslání všem
-                    """)
-                
+                handler = COMMAND_HANDLERS.get(cmd)
+                if handler is not None:
+                    if not handler(parts):
+                        break
+
                 else:
                     # Odeslání zprávy všem peerům (pokud není příkaz)
                     if not command.startswith("/"):
@@ -550,29 +1101,35 @@ Příklad použití:
                 print("\nUkončování...")
                 break
             except Exception as e:
-                logger.error(f"Chyba při zpracování příkazu: {e}", exc_info=True)
+                logger.error("Chyba při zpracování příkazu: %s", e, exc_info=True)
     
     finally:
         # Graceful shutdown
         peer_running.clear()
         
-        # Uzavření všech připojení
+        # Uzavření všech připojení - peer_running už je shozené, takže
+        # fronty reaktoru by nikdo nevyprázdnil; rozlučka jde najisto
+        # blokujícím sendall s krátkým timeoutem
         print("\nUzavírání připojení...")
-        with peers_lock:
-            for peer_address, (peer_socket, _, _) in list(connected_peers.items()):
-                try:
-                    send_message(peer_socket, "Peer se ukončuje...")
-                    peer_socket.close()
-                except:
-                    pass
-            connected_peers.clear()
-        
-        # Uzavření listeneru
-        if listener_socket:
+        goodbye = _frame("Peer se ukončuje...")
+        for peer_address, (peer_socket, _, _) in _peers_snapshot().items():
             try:
-                listener_socket.close()
+                peer_socket.settimeout(0.5)
+                peer_socket.sendall(goodbye)
+            except OSError:
+                pass
+            try:
+                peer_socket.close()
             except:
                 pass
+        with _writer_lock:
+            _peers_ref[0] = {}
+        with _hb_lock:
+            peer_heartbeats.clear()
+        
+        # Uzavření reaktoru
+        if reactor:
+            reactor.stop()
         
         logger.info("P2P aplikace ukončena")
         print("Aplikace ukončena")
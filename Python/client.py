@@ -1,12 +1,13 @@
 
 import socket
+import selectors
 import struct
 import logging
 import sys
 import threading
 import time
 import re
-from typing import Optional
+from typing import Dict, Optional
 
 # ANSI escape kódy pro barvy
 class Colors:
@@ -41,6 +42,24 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Předkompilovaný formát délkového prefixu - bez parsování formátu na každou zprávu
+_HDR = struct.Struct('>I')
+
+# Předkompilovaný regex pro barevný prefix chat zpráv - kompilace
+# jednou při importu místo na každou příchozí zprávu
+_COLOR_RE = re.compile(r'\[COLOR:(\d+)\]')
+
+# Předpočítané ANSI prefixy a sufix - konstantní části výstupu se
+# neskládají f-stringem na každou zprávu
+_RESET = Colors.RESET
+_PM_PREFIX = "\n" + Colors.MAGENTA
+_SYSTEM_PREFIX = "\n" + Colors.BRIGHT_BLUE + "[SYSTEM] "
+_P2P_LIST_PREFIX = "\n" + Colors.CYAN
+_ERROR_PREFIX = "\n" + Colors.RED
+_INFO_PREFIX = "\n" + Colors.BRIGHT_YELLOW
+_CHAT_PREFIX = "\n" + Colors.BRIGHT_GREEN
+_OTHER_PREFIX = "\n" + Colors.WHITE + "[Server] "
+
 
 def send_message(sock: socket.socket, message: str) -> bool:
     """
@@ -55,20 +74,57 @@ def send_message(sock: socket.socket, message: str) -> bool:
     """
     try:
         message_bytes = message.encode('utf-8')
-        message_length = len(message_bytes)
-        
-        # Odeslání délky zprávy (4 byty, big-endian)
-        length_prefix = struct.pack('>I', message_length)
-        sock.sendall(length_prefix)
-        
-        # Odeslání samotné zprávy
-        sock.sendall(message_bytes)
+        length_prefix = _HDR.pack(len(message_bytes))
+
+        if hasattr(sock, 'sendmsg'):
+            # Scatter-gather (writev): prefix i payload odejdou jedním
+            # syscallem bez spojování do nového bytes objektu
+            bufs = [memoryview(length_prefix), memoryview(message_bytes)]
+            while bufs:
+                sent = sock.sendmsg(bufs)
+                # Posun přes částečně odeslaná data - u krátkých zpráv
+                # se sem prakticky nikdy nevrátíme
+                while sent > 0:
+                    if sent >= len(bufs[0]):
+                        sent -= len(bufs[0])
+                        bufs.pop(0)
+                    else:
+                        bufs[0] = bufs[0][sent:]
+                        sent = 0
+        else:
+            # Fallback (Windows): rámec se složí do předalokovaného
+            # bufferu socketu - jeden sendall, žádná nová alokace na
+            # zprávu a žádné zdržení prefixu v samostatném TCP segmentu
+            n = len(message_bytes)
+            fd = sock.fileno()
+            buf = _send_buffers.get(fd)
+            if buf is None or len(buf) < 4 + n:
+                buf = _send_buffers[fd] = bytearray(max(4 + n, 4 + BUFFER_SIZE))
+            _HDR.pack_into(buf, 0, n)
+            buf[4:4 + n] = message_bytes
+            sock.sendall(memoryview(buf)[:4 + n])
         return True
     except Exception as e:
         logger.error(f"Chyba při odesílání zprávy: {e}")
         return False
 
 
+# Přijímací buffery podle file descriptoru - jeden buffer na socket,
+# aby se při každém recv nealokoval nový bytes objekt
+_recv_buffers: Dict[int, bytearray] = {}
+
+# Odesílací buffery pro fallback cestu bez sendmsg - rámec se skládá
+# přes pack_into do předalokovaného bytearray místo konkatenace
+_send_buffers: Dict[int, bytearray] = {}
+
+# MSG_WAITALL: kernel vrátí řízení až s kompletním počtem bytů, takže
+# hlavička i tělo přijdou jedním syscallem místo smyčky krátkých čtení.
+# Windows konstantu sice definuje, ale socket v timeout režimu je na
+# úrovni OS neblokující a WinSock na něm MSG_WAITALL odmítá
+# (WSAEOPNOTSUPP) - tam se příznak vypíná a zbytek dočte smyčka
+_MSG_WAITALL = getattr(socket, 'MSG_WAITALL', 0) if sys.platform != 'win32' else 0
+
+
 def receive_message(sock: socket.socket, timeout: float = MESSAGE_TIMEOUT) -> Optional[str]:
     """
     Přijme zprávu s prefixem délky
@@ -82,32 +138,50 @@ def receive_message(sock: socket.socket, timeout: float = MESSAGE_TIMEOUT) -> Op
     """
     try:
         sock.settimeout(timeout)
-        
-        # Přijetí délky zprávy (4 byty)
-        length_data = b''
-        while len(length_data) < 4:
-            chunk = sock.recv(4 - len(length_data))
-            if not chunk:
+
+        # Předalokovaný buffer pro tento socket (prefix + max. zpráva)
+        fd = sock.fileno()
+        buf = _recv_buffers.get(fd)
+        if buf is None:
+            buf = _recv_buffers[fd] = bytearray(4 + BUFFER_SIZE * 10)
+        mv = memoryview(buf)
+
+        # Přijetí délky zprávy (4 byty) přímo do bufferu. První čtení
+        # s MSG_WAITALL stáhne na blokujícím socketu celou hlavičku
+        # jedním syscallem; případný zbytek (timeout režim smí vrátit
+        # méně) dočte smyčka
+        got = sock.recv_into(mv[:4], 4, _MSG_WAITALL)
+        if not got:
+            return None
+        while got < 4:
+            n = sock.recv_into(mv[got:4])
+            if not n:
                 return None
-            length_data += chunk
-        
-        message_length = struct.unpack('>I', length_data)[0]
-        
+            got += n
+
+        message_length = _HDR.unpack_from(mv)[0]
+
         # Validace délky zprávy
         if message_length > BUFFER_SIZE * 10:  # Max 40KB zpráva
             logger.warning(f"Příliš dlouhá zpráva: {message_length} bytů")
             return None
-        
-        # Přijetí samotné zprávy
-        message_data = b''
-        while len(message_data) < message_length:
-            chunk = sock.recv(min(message_length - len(message_data), BUFFER_SIZE))
-            if not chunk:
+
+        # Přijetí samotné zprávy do téhož bufferu (žádné spojování chunků)
+        end = 4 + message_length
+        got = 4
+        if message_length:
+            n = sock.recv_into(mv[4:end], message_length, _MSG_WAITALL)
+            if not n:
                 return None
-            message_data += chunk
-        
-        return message_data.decode('utf-8')
-    
+            got += n
+        while got < end:
+            n = sock.recv_into(mv[got:end])
+            if not n:
+                return None
+            got += n
+
+        return bytes(mv[4:end]).decode('utf-8')
+
     except socket.timeout:
         # Timeout je normální při čekání na zprávy - nepotřebujeme warning
         return None
@@ -116,105 +190,303 @@ def receive_message(sock: socket.socket, timeout: float = MESSAGE_TIMEOUT) -> Op
         return None
 
 
-def receive_messages_thread(sock: socket.socket, running: threading.Event):
+def _handle_peer_info(message: str) -> str:
+    """
+    Sestaví výpis P2P informací o uživateli (PEER_INFO:username:ip:port)
+    """
+    # Ohraničený split - po čtyřech tokenech se přestane skenovat,
+    # případná další dvojtečka v datech nic nerozbije
+    parts = message.split(":", 3)
+    if len(parts) < 4:
+        return ""
+    peer_username = parts[1]
+    peer_ip = parts[2]
+    peer_port = parts[3]
+    return (f"\n[INFO] P2P informace o {peer_username}:\n"
+            f"  IP: {peer_ip}\n"
+            f"  Port: {peer_port}\n"
+            f"  Pro připojení použijte P2P aplikaci:\n"
+            f"    cd P2P/Python\n"
+            f"    python peer2peer.py\n"
+            f"    /connect {peer_ip} {peer_port}")
+
+
+def _handle_pm(message: str) -> str:
+    """
+    Soukromá zpráva přes server (magenta)
+    """
+    return _PM_PREFIX + message + _RESET
+
+
+def _handle_server(message: str) -> str:
+    """
+    Systémové zprávy (modře)
+    """
+    return _SYSTEM_PREFIX + message + _RESET
+
+
+def _handle_p2p_list(message: str) -> str:
+    """
+    Seznam P2P informací (cyan)
+    """
+    return _P2P_LIST_PREFIX + message + _RESET
+
+
+def _handle_color(message: str) -> str:
+    """
+    Chat zpráva s barvou uživatele: "[COLOR:XX][HH:MM] Uživatel: zpráva"
+    """
+    color_match = _COLOR_RE.match(message)
+    if color_match:
+        color_code = color_match.group(1)
+        # Odstranění [COLOR:XX] prefixu
+        message_without_color = _COLOR_RE.sub('', message)
+        # Použití barvy uživatele
+        user_color = f'\033[{color_code}m'
+        return "\n" + user_color + message_without_color + _RESET
+    return f"\n{message}"
+
+
+def _handle_error(message: str) -> str:
+    """
+    Chyby (červeně)
+    """
+    return _ERROR_PREFIX + message + _RESET
+
+
+def _handle_info(message: str) -> str:
+    """
+    Info zprávy (žlutě)
+    """
+    return _INFO_PREFIX + message + _RESET
+
+
+def _handle_default(message: str) -> str:
+    """
+    Fallback: chat zpráva "Uživatel: zpráva" zeleně, jinak bílý výpis
+    """
+    if ":" in message:
+        return _CHAT_PREFIX + message + _RESET
+    return _OTHER_PREFIX + message + _RESET
+
+
+# Dispatch tabulka podle prefixu - jeden průchod místo kaskády
+# startswith testů na každou příchozí zprávu; pořadí určuje prioritu
+_MESSAGE_HANDLERS = (
+    ("PEER_INFO:", _handle_peer_info),
+    ("[PM od", _handle_pm),
+    ("Server:", _handle_server),
+    ("P2P informace:", _handle_p2p_list),
+    ("[COLOR:", _handle_color),
+    ("ERROR", _handle_error),
+    ("INFO", _handle_info),
+)
+
+# Tabulka rozdělená podle prvního znaku - O(1) lookup vybere skupinu
+# nanejvýš dvou prefixů, takže na zprávu připadnou 1-2 startswith testy
+_HANDLERS_BY_FIRST_CHAR: Dict[str, tuple] = {}
+for _prefix, _handler in _MESSAGE_HANDLERS:
+    _HANDLERS_BY_FIRST_CHAR.setdefault(_prefix[0], [])
+    _HANDLERS_BY_FIRST_CHAR[_prefix[0]].append((_prefix, _handler))
+_HANDLERS_BY_FIRST_CHAR = {k: tuple(v) for k, v in _HANDLERS_BY_FIRST_CHAR.items()}
+
+
+def _print_incoming(message: str):
+    """
+    Zformátuje a vypíše jednu příchozí zprávu včetně promptu
+    """
+    # Klasifikace přes skupinu podle prvního znaku - místo
+    # průchodu celou tabulkou se testuje jen pár prefixů
+    for prefix, handler in _HANDLERS_BY_FIRST_CHAR.get(message[:1], ()):
+        if message.startswith(prefix):
+            out = handler(message)
+            break
+    else:
+        out = _handle_default(message)
+
+    # Celý výstup včetně promptu jedním write a jedním flush
+    # místo kaskády printů na každou zprávu
+    sys.stdout.write(out + "\n> ")
+    sys.stdout.flush()
+
+
+def _dispatch_command(client: socket.socket, message: str) -> bool:
+    """
+    Zpracuje jeden řádek uživatelského vstupu
+
+    Returns:
+        False pokud má hlavní smyčka skončit, jinak True
+    """
+    # Vstup rozdělíme jen jednou (a jen na potřebné tokeny),
+    # větve pak porovnávají hotové části
+    parts = message.split(None, 2)
+    cmd = parts[0] if parts else ''
+
+    # Speciální příkazy
+    if len(parts) == 1 and cmd.lower() in ('quit', 'exit', '/quit', '/exit'):
+        send_message(client, "/quit")
+        print("Odpojování...")
+        return False
+    elif cmd == "/getpeer" and len(parts) >= 2:
+        # Získání P2P informací o uživateli
+        send_message(client, message)
+    elif cmd == "/pm" and len(parts) >= 3:
+        # Soukromá zpráva přes server
+        send_message(client, message)
+    elif cmd == "/peers" and len(parts) == 1:
+        # Seznam všech uživatelů s P2P informacemi
+        send_message(client, message)
+    elif cmd == "/p2p" and len(parts) >= 2:
+        # Automatické připojení přes P2P
+        target_username = parts[1]
+        print(f"Získávám P2P informace o {target_username}...")
+        send_message(client, f"/getpeer {target_username}")
+    else:
+        # Odeslání zprávy serveru (server ji automaticky pošle všem v chatu)
+        if not send_message(client, message):
+            print("Chyba: Nepodařilo se odeslat zprávu")
+            return False
+    return True
+
+
+def _chat_loop_single_thread(client: socket.socket, running: threading.Event):
+    """
+    Obsluha obou směrů komunikace jedním vláknem (POSIX)
+
+    Selector čeká současně na stdin i socket, takže odpadá receive
+    vlákno, jeho synchronizace i GIL přepínání mezi dvěma vlákny.
+
+    Args:
+        client: Připojený socket serveru
+        running: Event pro ukončení smyčky
+    """
+    sel = selectors.DefaultSelector()
+    sel.register(client, selectors.EVENT_READ)
+    sel.register(sys.stdin, selectors.EVENT_READ)
+
+    sys.stdout.write("> ")
+    sys.stdout.flush()
+
+    try:
+        while running.is_set():
+            for key, _ in sel.select():
+                if key.fileobj is sys.stdin:
+                    line = sys.stdin.readline()
+                    if not line:
+                        # Ctrl+D nebo konec vstupu
+                        print("\nUkončování...")
+                        send_message(client, "/quit")
+                        running.clear()
+                        break
+
+                    message = line.strip()
+                    if message and not _dispatch_command(client, message):
+                        running.clear()
+                        break
+
+                    sys.stdout.write("> ")
+                    sys.stdout.flush()
+                else:
+                    message = receive_message(client)
+                    if not message:
+                        # Server uzavřel spojení
+                        print("\nSpojení ukončeno")
+                        running.clear()
+                        break
+
+                    # Zpracování heartbeat ping
+                    if message == "PING":
+                        send_message(client, "PONG")
+                        continue
+
+                    _print_incoming(message)
+    except KeyboardInterrupt:
+        # Ctrl+C
+        print("\n\nUkončování...")
+        send_message(client, "/quit")
+    except (OSError, ConnectionResetError, ConnectionAbortedError):
+        if running.is_set():
+            print("\nSpojení ukončeno")
+            running.clear()
+    finally:
+        sel.close()
+
+
+def receive_messages_thread(sock: socket.socket, running: threading.Event, wakeup: socket.socket):
     """
     Vlákno pro přijímání zpráv ze serveru na pozadí
-    
+
+    Blokuje v selectoru bez timeoutu - žádné periodické probouzení
+    kvůli kontrole running. Ukončení signalizuje main zápisem do
+    budícího socketu (socketpair). Vlákno běží jen na Windows, kde
+    select() umí čekat pouze na sockety - obyčejná roura z os.pipe()
+    by registraci shodila s WinError 10038.
+
     Args:
         sock: Socket pro přijetí
         running: Event pro kontrolu běhu vlákna
+        wakeup: Čtecí konec socketpair pro probuzení při shutdownu
     """
-    while running.is_set():
-        try:
-            # Kontrola, zda je socket stále platný
-            if sock.fileno() == -1:
-                # Socket je uzavřen
-                break
-            
-            # Použijeme kratší timeout pro kontrolu, ale neukončíme spojení při timeoutu
-            message = receive_message(sock, timeout=2.0)
-            if message:
+    sel = selectors.DefaultSelector()
+    sel.register(sock, selectors.EVENT_READ)
+    sel.register(wakeup, selectors.EVENT_READ)
+
+    try:
+        while running.is_set():
+            try:
+                events = sel.select()
+
+                woken = False
+                readable = False
+                for key, _ in events:
+                    if key.fileobj is wakeup:
+                        wakeup.recv(4096)
+                        woken = True
+                    else:
+                        readable = True
+
+                if woken:
+                    break
+                if not readable:
+                    continue
+
+                message = receive_message(sock)
+                if not message:
+                    # Selector hlásil čitelnost, ale zpráva nepřišla -
+                    # server uzavřel spojení
+                    if running.is_set():
+                        print(f"\nSpojení ukončeno")
+                        running.clear()
+                    break
                 # Zpracování heartbeat ping
                 if message == "PING":
                     # Odpověď na ping
                     send_message(sock, "PONG")
                     continue
-                
-                # Zpracování P2P informací
-                if message.startswith("PEER_INFO:"):
-                    # Formát: PEER_INFO:username:ip:port
-                    parts = message.split(":")
-                    if len(parts) >= 4:
-                        peer_username = parts[1]
-                        peer_ip = parts[2]
-                        peer_port = parts[3]
-                        print(f"\n[INFO] P2P informace o {peer_username}:")
-                        print(f"  IP: {peer_ip}")
-                        print(f"  Port: {peer_port}")
-                        print(f"  Pro připojení použijte P2P aplikaci:")
-                        print(f"    cd P2P/Python")
-                        print(f"    python peer2peer.py")
-                        print(f"    /connect {peer_ip} {peer_port}")
-                elif message.startswith("[PM od"):
-                    # Soukromá zpráva přes server (magenta)
-                    print(f"\n{Colors.MAGENTA}{message}{Colors.RESET}")
-                elif message.startswith("Server:"):
-                    # Systémové zprávy (modře)
-                    print(f"\n{Colors.BRIGHT_BLUE}[SYSTEM] {message}{Colors.RESET}")
-                elif message.startswith("P2P informace:"):
-                    # Seznam P2P informací (cyan)
-                    print(f"\n{Colors.CYAN}{message}{Colors.RESET}")
-                elif message.startswith("[COLOR:") and ":" in message:
-                    # Chat zpráva s barvou uživatele
-                    # Formát: "[COLOR:XX][HH:MM] Uživatel: zpráva"
-                    import re
-                    color_match = re.match(r'\[COLOR:(\d+)\]', message)
-                    if color_match:
-                        color_code = color_match.group(1)
-                        # Odstranění [COLOR:XX] prefixu
-                        message_without_color = re.sub(r'\[COLOR:\d+\]', '', message)
-                        # Použití barvy uživatele
-                        user_color = f'\033[{color_code}m'
-                        print(f"\n{user_color}{message_without_color}{Colors.RESET}")
-                    else:
-                        print(f"\n{message}")
-                elif message.startswith("[") and ":" in message and not message.startswith("ERROR") and not message.startswith("INFO"):
-                    # Chat zpráva od uživatele s časovým razítkem (zeleně) - fallback
-                    # Formát: "[HH:MM] Uživatel: zpráva"
-                    print(f"\n{Colors.BRIGHT_GREEN}{message}{Colors.RESET}")
-                elif ":" in message and not message.startswith("ERROR") and not message.startswith("INFO"):
-                    # Chat zpráva od uživatele bez časového razítka (zeleně) - fallback
-                    print(f"\n{Colors.BRIGHT_GREEN}{message}{Colors.RESET}")
-                elif message.startswith("ERROR"):
-                    # Chyby (červeně)
-                    print(f"\n{Colors.RED}{message}{Colors.RESET}")
-                elif message.startswith("INFO"):
-                    # Info zprávy (žlutě)
-                    print(f"\n{Colors.BRIGHT_YELLOW}{message}{Colors.RESET}")
-                else:
-                    # Jiné zprávy (bíle)
-                    print(f"\n{Colors.WHITE}[Server] {message}{Colors.RESET}")
-                print("> ", end="", flush=True)
-            # Timeout (message is None) je normální - pokračujeme v čekání
-        except socket.timeout:
-            # Timeout je normální, pokračujeme
-            continue
-        except (OSError, ConnectionResetError, ConnectionAbortedError) as e:
-            # Spojení bylo skutečně ukončeno
-            if running.is_set():
-                # Nezobrazujeme chybu, pokud jsme to ukončili sami
-                if "10038" not in str(e):  # Ignorujeme chybu uzavřeného socketu
-                    print(f"\nSpojení ukončeno")
-                running.clear()
-            break
-        except Exception as e:
-            # Jiná chyba - pouze pokud je socket stále otevřený
-            if running.is_set() and sock.fileno() != -1:
-                # Ignorujeme chyby uzavřeného socketu
-                if "10038" not in str(e) and "10053" not in str(e):
-                    logger.debug(f"Chyba v receive thread: {e}")
+
+                _print_incoming(message)
+            except socket.timeout:
+                # Timeout je normální, pokračujeme
                 continue
-            break
+            except (OSError, ConnectionResetError, ConnectionAbortedError) as e:
+                # Spojení bylo skutečně ukončeno
+                if running.is_set():
+                    # Nezobrazujeme chybu, pokud jsme to ukončili sami
+                    if "10038" not in str(e):  # Ignorujeme chybu uzavřeného socketu
+                        print(f"\nSpojení ukončeno")
+                    running.clear()
+                break
+            except Exception as e:
+                # Jiná chyba - uzavřený socket hlásí OSError větví výše,
+                # stačí tedy kontrolovat running bez sahání na fileno()
+                if running.is_set():
+                    # Ignorujeme chyby uzavřeného socketu
+                    if "10038" not in str(e) and "10053" not in str(e):
+                        logger.debug(f"Chyba v receive thread: {e}")
+                    continue
+                break
+    finally:
+        sel.close()
 
 
 def main():
@@ -224,12 +496,22 @@ def main():
     client = None
     receive_thread = None
     running = threading.Event()
-    
+
+    # Budící kanál pro probuzení receive vlákna při shutdownu - vlákno
+    # tak může blokovat v selectoru bez periodického timeoutu.
+    # socketpair místo os.pipe(), protože select() na Windows umí čekat
+    # jen na sockety
+    wakeup_r, wakeup_w = socket.socketpair()
+
     try:
         # Vytvoření socketu
         # AF_INET = IPv4, SOCK_STREAM = TCP
         client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        
+
+        # Vypnutí Nagleova algoritmu - chatové zprávy jsou malé a latence
+        # je důležitější než slučování segmentů
+        client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
         # Nastavení timeoutu pro připojení (pouze pro connect)
         client.settimeout(CONNECTION_TIMEOUT)
         
@@ -265,74 +547,58 @@ def main():
         
         # Odeslání informací serveru
         send_message(client, f"SETUP:{username}:{p2p_port}")
-        
-        # Spuštění vlákna pro přijímání zpráv (před zobrazením promptu)
+
         running.set()
-        receive_thread = threading.Thread(
-            target=receive_messages_thread,
-            args=(client, running),
-            daemon=True
-        )
-        receive_thread.start()
-        
-        # Počkat chvíli, aby se přijala uvítací zpráva
-        import time
-        time.sleep(0.2)
-        
+
         print("\n=== Chat připojen ===")
         print("Napište zprávu a stiskněte Enter pro odeslání všem uživatelům")
         print("Použijte '/help' pro nápovědu, '/quit' pro odpojení\n")
-        
-        # Hlavní smyčka pro komunikaci
-        while running.is_set():
-            try:
-                # Čtení zprávy od uživatele
-                message = input("> ").strip()
-                
-                if not message:
-                    continue
-                
-                # Speciální příkazy
-                if message.lower() in ['quit', 'exit', '/quit', '/exit']:
+
+        if sys.platform != 'win32':
+            # POSIX: jedno vlákno obsluhuje stdin i socket přes selector -
+            # žádné receive vlákno ani synchronizace mezi vlákny
+            _chat_loop_single_thread(client, running)
+        else:
+            # Windows: selectors neumí čekat na konzolový stdin, zůstává
+            # vlákno pro příjem + blokující input()
+            receive_thread = threading.Thread(
+                target=receive_messages_thread,
+                args=(client, running, wakeup_r),
+                daemon=True
+            )
+            receive_thread.start()
+
+            # Počkat chvíli, aby se přijala uvítací zpráva
+            time.sleep(0.2)
+
+            # Hlavní smyčka pro komunikaci
+            while running.is_set():
+                try:
+                    # Čtení zprávy od uživatele
+                    message = input("> ").strip()
+
+                    if not message:
+                        continue
+
+                    if not _dispatch_command(client, message):
+                        break
+
+                    # V chat módu všechny zprávy přicházejí přes receive thread
+                    # (včetně vlastní zprávy, která se broadcastuje zpět)
+
+                except EOFError:
+                    # Ctrl+D nebo konec vstupu
+                    print("\nUkončování...")
                     send_message(client, "/quit")
-                    print("Odpojování...")
                     break
-                elif message.startswith("/getpeer ") and len(message.split()) >= 2:
-                    # Získání P2P informací o uživateli
-                    send_message(client, message)
-                elif message.startswith("/pm ") and len(message.split()) >= 3:
-                    # Soukromá zpráva přes server
-                    send_message(client, message)
-                elif message == "/peers":
-                    # Seznam všech uživatelů s P2P informacemi
-                    send_message(client, message)
-                elif message.startswith("/p2p ") and len(message.split()) >= 2:
-                    # Automatické připojení přes P2P
-                    target_username = message.split()[1]
-                    print(f"Získávám P2P informace o {target_username}...")
-                    send_message(client, f"/getpeer {target_username}")
-                else:
-                    # Odeslání zprávy serveru (server ji automaticky pošle všem v chatu)
-                    if not send_message(client, message):
-                        print("Chyba: Nepodařilo se odeslat zprávu")
-                        break
-                
-                # V chat módu všechny zprávy přicházejí přes receive thread
-                # (včetně vlastní zprávy, která se broadcastuje zpět)
-                
-            except EOFError:
-                # Ctrl+D nebo konec vstupu
-                print("\nUkončování...")
-                send_message(client, "/quit")
-                break
-            except KeyboardInterrupt:
-                # Ctrl+C
-                print("\n\nUkončování...")
-                send_message(client, "/quit")
-                break
-            except Exception as e:
-                logger.error(f"Chyba při komunikaci: {e}")
-                break
+                except KeyboardInterrupt:
+                    # Ctrl+C
+                    print("\n\nUkončování...")
+                    send_message(client, "/quit")
+                    break
+                except Exception as e:
+                    logger.error(f"Chyba při komunikaci: {e}")
+                    break
     
     except Exception as e:
         print(f"Kritická chyba: {e}")
@@ -341,11 +607,23 @@ def main():
     finally:
         # Ukončení vlákna
         running.clear()
-        
+
+        # Probuzení receive vlákna blokujícího v selectoru
+        try:
+            wakeup_w.send(b'\0')
+        except OSError:
+            pass
+
         # Počkat na dokončení receive thread
         if receive_thread and receive_thread.is_alive():
             receive_thread.join(timeout=0.5)
-        
+
+        for wsock in (wakeup_r, wakeup_w):
+            try:
+                wsock.close()
+            except OSError:
+                pass
+
         # Uzavření socketu
         if client:
             try:
@@ -1,10 +1,13 @@
+import os
 import socket
+import selectors
 import threading
 import logging
 import struct
 import time
-from datetime import datetime
-from typing import List, Tuple, Optional
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, Tuple, Optional
 
 # Konfigurace
 DEFAULT_HOST = '0.0.0.0'
@@ -17,6 +20,8 @@ HEARTBEAT_INTERVAL = 300.0  # Interval pro heartbeat (sekundy)
 HEARTBEAT_TIMEOUT = 100.0  # Timeout pro heartbeat odpověď (sekundy)
 RATE_LIMIT_MESSAGES = 10  # Maximální počet zpráv
 RATE_LIMIT_WINDOW = 1.0  # Časové okno v sekundách
+SOCKET_BUFFER_TARGET = 262144  # Cílová velikost SO_SNDBUF/SO_RCVBUF (bajty)
+MAX_OUTBOUND = 1024 * 1024  # Strop odchozí fronty klienta - pak odpojení (bajty)
 
 # Nastavení logování
 logging.basicConfig(
@@ -26,6 +31,10 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Předkompilovaný kodek prefixu délky - parsování formátu '>I' se
+# neopakuje při každé zprávě
+_HDR = struct.Struct('>I')
+
 # Paleta barev pro uživatele (ANSI escape kódy)
 USER_COLORS = [
     '\033[31m',  # Červená
@@ -42,19 +51,169 @@ USER_COLORS = [
     '\033[96m',  # Světle cyan
 ]
 
-# Struktura pro uložení informací o klientovi
-# (socket, address, username, p2p_port, last_heartbeat, last_message_time, message_count, color_code)
-# address je (IP, port) - port, na kterém se klient připojil k serveru
-# p2p_port je port, na kterém klient naslouchá pro P2P připojení
-# last_heartbeat je čas posledního úspěšného heartbeat
-# last_message_time je čas poslední zprávy pro rate limiting
-# message_count je počet zpráv v aktuálním okně
-# color_code je ANSI escape kód pro barvu uživatele
-clients: List[Tuple[socket.socket, Tuple[str, int], str, int, float, float, int, str]] = []  # (socket, address, username, p2p_port, last_heartbeat, last_message_time, message_count, color_code)
+@dataclass
+class ClientState:
+    """
+    Stav jednoho připojeného klienta
+
+    Dříve byl každý klient osmice v seznamu a každá aktualizace
+    (heartbeat, rate limit) znamenala lineární hledání a sestavení
+    nové osmice. Mutovatelný objekt se __slots__ umožňuje změnit
+    jedno pole na místě bez kopírování.
+    """
+    __slots__ = ('sock', 'addr', 'username', 'p2p_port',
+                 'last_heartbeat', 'last_message_time', 'message_count', 'color',
+                 'chat_pre', 'chat_sep')
+    sock: socket.socket                 # socket klienta
+    addr: Tuple[str, int]               # (IP, port) připojení k serveru
+    username: str                       # uživatelské jméno
+    p2p_port: int                       # port, na kterém klient naslouchá pro P2P
+    last_heartbeat: float               # čas posledního úspěšného heartbeat
+    last_message_time: float            # čas poslední zprávy pro rate limiting
+    message_count: int                  # počet zpráv v aktuálním okně
+    color: str                          # číslo ANSI barvy uživatele
+    chat_pre: bytes                     # předkódovaný prefix "[COLOR:c][" chatové zprávy
+    chat_sep: bytes                     # předkódovaný oddělovač "] jmeno: " chatové zprávy
+
+
+# Registr klientů: klíč je fileno() socketu, takže operace nad jedním
+# klientem jsou O(1) místo procházení celého seznamu
+clients: Dict[int, ClientState] = {}
+# Index podle malých písmen jména pro O(1) vyhledání v /pm a /getpeer
+clients_by_name: Dict[str, ClientState] = {}
 clients_lock = threading.Lock()  # Zámek pro thread-safe přístup
 server_running = threading.Event()
 server_running.set()
 
+# Cache formátovaného času [HH:MM, epochová minuta, HH:MM jako bytes] -
+# strftime se volá jen při změně minuty místo při každé chatové zprávě
+_hhmm_cache = ["", -1, b""]
+
+
+def _now_hhmm() -> str:
+    """Vrátí aktuální čas HH:MM, formátovaný nejvýše jednou za minutu"""
+    minute = int(time.time() // 60)
+    if minute != _hhmm_cache[1]:
+        _hhmm_cache[0] = time.strftime("%H:%M")
+        _hhmm_cache[1] = minute
+        _hhmm_cache[2] = _hhmm_cache[0].encode('ascii')
+    return _hhmm_cache[0]
+
+
+def _now_hhmm_bytes() -> bytes:
+    """Vrátí aktuální čas HH:MM jako bytes pro skládání chatového rámce"""
+    _now_hhmm()
+    return _hhmm_cache[2]
+
+
+# Přijímací buffery podle fileno() socketu - jedna alokace na klienta,
+# recv_into pak zapisuje přímo do ní místo skládání bytes po kouskách
+_recv_buffers: Dict[int, bytearray] = {}
+_MAX_MESSAGE = BUFFER_SIZE * 10  # Max 40KB zpráva
+
+# Odesílací buffery podle fileno() - rámec se skládá pack_into do
+# recyklované bytearray místo spojování dvou bytes objektů
+_send_buffers: Dict[int, bytearray] = {}
+
+# Selector, kterým jedno čtecí vlákno multiplexuje všechny klientské
+# sockety - místo vlákna blokujícího v recv pro každého klienta.
+# Vytváří se v main()
+_reader_selector: Optional[selectors.DefaultSelector] = None
+
+# Stavy spojení registrovaných u selectoru podle fileno() - kromě
+# rámování příjmu nesou i odchozí frontu pro neblokující odesílání
+_conns: Dict[int, dict] = {}
+_out_lock = threading.Lock()  # Chrání odchozí fronty ('out'/'out_off')
+_pending_lock = threading.Lock()
+_write_pending: list = []  # fd čekající na zapnutí EVENT_WRITE čtecím vláknem
+# Probouzecí roura - selector spí až sekundu a zápis do fronty z jiného
+# vlákna ho potřebuje vzbudit hned. Vytváří se v main()
+_wakeup_r = -1
+_wakeup_w = -1
+
+# Fond vláken pro handshake nových klientů - nastavuje main()
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _register_client(state: ClientState):
+    """Zapíše klienta do registru i jmenného indexu (volat pod zámkem)"""
+    clients[state.sock.fileno()] = state
+    clients_by_name[state.username.lower()] = state
+
+
+def _unregister_client(state: ClientState):
+    """Odebere klienta z registru i jmenného indexu (volat pod zámkem)"""
+    fd = state.sock.fileno()
+    clients.pop(fd, None)
+    _recv_buffers.pop(fd, None)
+    _send_buffers.pop(fd, None)
+    # Při duplicitním jménu smažeme index jen pokud ukazuje na nás
+    key = state.username.lower()
+    if clients_by_name.get(key) is state:
+        del clients_by_name[key]
+        # Handshake duplicitní jména nezakazuje - index se přesměruje
+        # na dalšího připojeného klienta se stejným jménem, jinak by
+        # pro /pm a /getpeer zůstal nedosažitelný. Lineární průchod
+        # jen při odpojení, horké cesty zůstávají O(1)
+        for other in clients.values():
+            if other.username.lower() == key:
+                clients_by_name[key] = other
+                break
+
+
+def tune_socket_buffers(sock: socket.socket):
+    """
+    Zvětší odesílací a přijímací buffer socketu na SOCKET_BUFFER_TARGET
+
+    Výchozí velikosti jádra bývají malé a broadcast pak blokuje na
+    pomalém klientovi. Zvětšujeme jen pokud je aktuální hodnota menší
+    než cíl - explicitní setsockopt vypíná autotuning jádra, takže ho
+    nechceme přepisovat zbytečně.
+
+    Args:
+        sock: Socket k nastavení
+    """
+    try:
+        if sock.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF) < SOCKET_BUFFER_TARGET:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_BUFFER_TARGET)
+        if sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF) < SOCKET_BUFFER_TARGET:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFFER_TARGET)
+    except OSError as e:
+        logger.debug("Nelze nastavit buffery socketu: %s", e)
+
+
+def _build_frame(message: str) -> bytes:
+    """
+    Sestaví hotový drátový rámec (prefix délky + UTF-8 payload)
+
+    Args:
+        message: Zpráva k zarámování
+
+    Returns:
+        Rámec připravený k odeslání
+    """
+    message_bytes = message.encode('utf-8')
+    return _HDR.pack(len(message_bytes)) + message_bytes
+
+
+def _send_frame(sock: socket.socket, frame: bytes) -> bool:
+    """
+    Odešle předpřipravený rámec
+
+    Args:
+        sock: Socket pro odeslání
+        frame: Hotový rámec z _build_frame
+
+    Returns:
+        True pokud úspěšné, False jinak
+    """
+    try:
+        sock.sendall(frame)
+        return True
+    except Exception as e:
+        logger.error(f"Chyba při odesílání zprávy: {e}")
+        return False
+
 
 def send_message(sock: socket.socket, message: str) -> bool:
     """
@@ -70,13 +229,36 @@ def send_message(sock: socket.socket, message: str) -> bool:
     try:
         message_bytes = message.encode('utf-8')
         message_length = len(message_bytes)
-        
-        # Odeslání délky zprávy (4 byty, big-endian)
-        length_prefix = struct.pack('>I', message_length)
-        sock.sendall(length_prefix)
-        
-        # Odeslání samotné zprávy
-        sock.sendall(message_bytes)
+
+        # Délka zprávy (4 byty, big-endian)
+        length_prefix = _HDR.pack(message_length)
+
+        if hasattr(sock, 'sendmsg'):
+            # Scatter-gather (writev): prefix i payload odejdou jedním
+            # syscallem - broadcast pro N klientů tak stojí N syscallů
+            # místo 2N
+            bufs = [memoryview(length_prefix), memoryview(message_bytes)]
+            while bufs:
+                sent = sock.sendmsg(bufs)
+                # Posun přes částečně odeslaná data
+                while sent > 0:
+                    if sent >= len(bufs[0]):
+                        sent -= len(bufs[0])
+                        bufs.pop(0)
+                    else:
+                        bufs[0] = bufs[0][sent:]
+                        sent = 0
+        else:
+            # Fallback (Windows): rámec se složí v recyklovaném bufferu
+            # klienta a odejde jedním sendall bez spojování bytes
+            fd = sock.fileno()
+            buf = _send_buffers.get(fd)
+            need = 4 + message_length
+            if buf is None or len(buf) < need:
+                buf = _send_buffers[fd] = bytearray(max(need, BUFFER_SIZE))
+            _HDR.pack_into(buf, 0, message_length)
+            buf[4:need] = message_bytes
+            sock.sendall(memoryview(buf)[:need])
         return True
     except Exception as e:
         logger.error(f"Chyba při odesílání zprávy: {e}")
@@ -96,32 +278,39 @@ def receive_message(sock: socket.socket, timeout: float = MESSAGE_TIMEOUT) -> Op
     """
     try:
         sock.settimeout(timeout)
-        
-        # Přijetí délky zprávy (4 byty)
-        length_data = b''
-        while len(length_data) < 4:
-            chunk = sock.recv(4 - len(length_data))
-            if not chunk:
+
+        # Buffer pro tohoto klienta (vytvoří se při prvním volání)
+        fd = sock.fileno()
+        buf = _recv_buffers.get(fd)
+        if buf is None:
+            buf = _recv_buffers[fd] = bytearray(4 + _MAX_MESSAGE)
+        mv = memoryview(buf)
+
+        # Přijetí délky zprávy (4 byty) - kernel zapisuje rovnou do bufferu
+        got = 0
+        while got < 4:
+            n = sock.recv_into(mv[got:4])
+            if n == 0:
                 return None
-            length_data += chunk
-        
-        message_length = struct.unpack('>I', length_data)[0]
-        
+            got += n
+
+        message_length = _HDR.unpack_from(buf, 0)[0]
+
         # Validace délky zprávy
-        if message_length > BUFFER_SIZE * 10:  # Max 40KB zpráva
+        if message_length > _MAX_MESSAGE:
             logger.warning(f"Příliš dlouhá zpráva: {message_length} bytů")
             return None
-        
-        # Přijetí samotné zprávy
-        message_data = b''
-        while len(message_data) < message_length:
-            chunk = sock.recv(min(message_length - len(message_data), BUFFER_SIZE))
-            if not chunk:
+
+        # Přijetí samotné zprávy do téhož bufferu za hlavičku
+        end = 4 + message_length
+        while got < end:
+            n = sock.recv_into(mv[got:end])
+            if n == 0:
                 return None
-            message_data += chunk
-        
-        return message_data.decode('utf-8')
-    
+            got += n
+
+        return bytes(mv[4:end]).decode('utf-8')
+
     except socket.timeout:
         # Timeout je normální při čekání na zprávy
         return None
@@ -143,48 +332,48 @@ def get_user_color(client_index: int) -> str:
     return USER_COLORS[client_index % len(USER_COLORS)]
 
 
-def check_rate_limit(client_socket: socket.socket) -> bool:
+def touch_and_check_rate_limit(state: ClientState) -> bool:
     """
-    Kontrola rate limitingu pro klienta
-    
+    Aktualizace heartbeat a kontrola rate limitingu jedním dotykem
+
+    Každá zpráva dříve volala zvlášť kontrolu rate limitu a zvlášť
+    aktualizaci heartbeat; obě pracují nad týmž stavem a stejným časem,
+    tak jsou sloučené. Pole mění jen obslužné vlákno daného klienta,
+    takže není potřeba globální zámek.
+
     Args:
-        client_socket: Socket klienta
-        
+        state: Stav klienta
+
     Returns:
         True pokud je zpráva povolena, False pokud je rate limit překročen
     """
-    current_time = time.time()
-    with clients_lock:
-        for i, (sock, addr, uname, p2p_port, last_hb, last_msg_time, msg_count, color) in enumerate(clients):
-            if sock == client_socket:
-                # Kontrola, zda uplynulo dost času pro reset okna
-                if current_time - last_msg_time >= RATE_LIMIT_WINDOW:
-                    # Reset okna
-                    clients[i] = (sock, addr, uname, p2p_port, last_hb, current_time, 1, color)
-                    return True
-                elif msg_count < RATE_LIMIT_MESSAGES:
-                    # Zvýšení počtu zpráv
-                    clients[i] = (sock, addr, uname, p2p_port, last_hb, last_msg_time, msg_count + 1, color)
-                    return True
-                else:
-                    # Rate limit překročen
-                    return False
-    return True
+    current_time = time.monotonic()
+    state.last_heartbeat = current_time
+    # Kontrola, zda uplynulo dost času pro reset okna
+    if current_time - state.last_message_time >= RATE_LIMIT_WINDOW:
+        # Reset okna
+        state.last_message_time = current_time
+        state.message_count = 1
+        return True
+    elif state.message_count < RATE_LIMIT_MESSAGES:
+        # Zvýšení počtu zpráv
+        state.message_count += 1
+        return True
+    else:
+        # Rate limit překročen
+        return False
 
 
-def update_heartbeat(client_socket: socket.socket):
+def update_heartbeat(state: ClientState):
     """
     Aktualizace času posledního heartbeat pro klienta
-    
+
+    Zápis jednoho atributu je pod GIL atomický, zámek není potřeba.
+
     Args:
-        client_socket: Socket klienta
+        state: Stav klienta
     """
-    current_time = time.time()
-    with clients_lock:
-        for i, (sock, addr, uname, p2p_port, last_hb, last_msg_time, msg_count, color) in enumerate(clients):
-            if sock == client_socket:
-                clients[i] = (sock, addr, uname, p2p_port, current_time, last_msg_time, msg_count, color)
-                break
+    state.last_heartbeat = time.monotonic()
 
 
 def heartbeat_monitor():
@@ -193,34 +382,29 @@ def heartbeat_monitor():
     """
     while server_running.is_set():
         time.sleep(HEARTBEAT_INTERVAL)
-        current_time = time.time()
+        current_time = time.monotonic()
         disconnected = []
         
         with clients_lock:
-            for client_sock, address, username, p2p_port, last_heartbeat, last_msg_time, msg_count, color in clients:
+            for state in clients.values():
                 # Kontrola, zda klient neodpovídá příliš dlouho
-                if current_time - last_heartbeat > HEARTBEAT_TIMEOUT * 2:
-                    logger.warning(f"Klient {username} ({address}) neodpovídá na heartbeat - odpojování")
-                    disconnected.append((client_sock, address, username, p2p_port, last_heartbeat, last_msg_time, msg_count, color))
+                if current_time - state.last_heartbeat > HEARTBEAT_TIMEOUT * 2:
+                    logger.warning(f"Klient {state.username} ({state.addr}) neodpovídá na heartbeat - odpojování")
+                    disconnected.append(state)
                 else:
-                    # Odeslání ping zprávy
+                    # Odeslání ping zprávy - přes frontu, přímý zápis
+                    # by se křížil se zápisy čtecího vlákna
                     try:
-                        send_message(client_sock, "PING")
+                        if not _queue_frame(state, _PING_FRAME):
+                            disconnected.append(state)
                     except Exception as e:
-                        logger.warning(f"Nelze odeslat ping klientovi {username} ({address}): {e}")
-                        disconnected.append((client_sock, address, username, p2p_port, last_heartbeat, last_msg_time, msg_count, color))
-        
+                        logger.warning(f"Nelze odeslat ping klientovi {state.username} ({state.addr}): {e}")
+                        disconnected.append(state)
+
         # Odstranění odpojených klientů
-        if disconnected:
-            with clients_lock:
-                for client_info in disconnected:
-                    if client_info in clients:
-                        clients.remove(client_info)
-                        try:
-                            client_info[0].close()
-                        except:
-                            pass
-                        logger.info(f"Klient {client_info[2]} odpojen kvůli timeoutu heartbeat")
+        for state in disconnected:
+            logger.info(f"Klient {state.username} odpojen kvůli timeoutu heartbeat")
+            _disconnect_client(state)
 
 
 def broadcast_message(message: str, exclude_socket: Optional[socket.socket] = None) -> int:
@@ -231,39 +415,66 @@ def broadcast_message(message: str, exclude_socket: Optional[socket.socket] = No
         message: Zpráva k odeslání
         exclude_socket: Socket, který má být vynechán (např. odesílatel)
         
+    Returns:
+        Počet úspěšně odeslaných zpráv
+    """
+    return _broadcast_payload(message.encode('utf-8'), exclude_socket)
+
+
+def _broadcast_payload(payload: bytes, exclude_socket: Optional[socket.socket] = None) -> int:
+    """
+    Odešle už zakódovanou zprávu všem připojeným klientům
+
+    Args:
+        payload: Tělo zprávy v UTF-8 (bez délkové hlavičky)
+        exclude_socket: Socket, který má být vynechán (např. odesílatel)
+
     Returns:
         Počet úspěšně odeslaných zpráv
     """
     sent_count = 0
     disconnected_clients = []
-    
+
+    # Rámec se sestaví jednou - pro N příjemců by send_message N-krát
+    # opakovala totéž kódování a balení délky
+    frame = _HDR.pack(len(payload)) + payload
+
+    # Zámek kryje jen zkopírování seznamu; samotné doručení je
+    # neblokující zařazení do front, které vyprazdňuje čtecí vlákno
     with clients_lock:
-        for client_sock, address, username, p2p_port, last_heartbeat, last_msg_time, msg_count, color in clients:
-            if exclude_socket and client_sock == exclude_socket:
-                continue
-            
-            try:
-                if send_message(client_sock, message):
-                    sent_count += 1
-                else:
-                    disconnected_clients.append((client_sock, address, username, p2p_port, last_heartbeat, last_msg_time, msg_count, color))
-            except Exception as e:
-                logger.error(f"Chyba při broadcastu klientovi {address}: {e}")
-                disconnected_clients.append((client_sock, address, username, p2p_port, last_heartbeat, last_msg_time, msg_count, color))
-        
-        # Odstranění odpojených klientů
-        for client_info in disconnected_clients:
-            if client_info in clients:
-                clients.remove(client_info)
-                logger.info(f"Klient {client_info[1]} odstraněn z broadcastu")
+        snapshot = list(clients.values())
+
+    for state in snapshot:
+        if exclude_socket and state.sock == exclude_socket:
+            continue
+
+        try:
+            if _queue_frame(state, frame):
+                sent_count += 1
+            else:
+                # Fronta přetekla MAX_OUTBOUND - klient nestíhá číst
+                logger.warning(f"Odchozí fronta klienta {state.addr} přetekla - odpojování")
+                disconnected_clients.append(state)
+        except Exception as e:
+            logger.error(f"Chyba při broadcastu klientovi {state.addr}: {e}")
+            disconnected_clients.append(state)
+
+    # Tichý úklid odpojených - bez oznámení, ať se broadcast nezacyklí
+    for state in disconnected_clients:
+        if _drop_client(state):
+            logger.info(f"Klient {state.addr} odstraněn z broadcastu")
     
     return sent_count
 
 
 def handle_client(client_socket: socket.socket, address: Tuple[str, int]):
     """
-    Funkce pro obsluhu jednoho klienta
-    
+    Handshake nového klienta a jeho předání čtecímu vláknu
+
+    Blokující příjem se používá jen pro úvodní USERNAME:/SETUP: zprávu;
+    potom se socket přepne na neblokující režim a zaregistruje do
+    selectoru, takže žádné vlákno nezůstává viset v recv.
+
     Args:
         client_socket: Socket objekt klienta
         address: Tuple (IP adresa, port) klienta
@@ -271,11 +482,8 @@ def handle_client(client_socket: socket.socket, address: Tuple[str, int]):
     username = f"User_{address[1]}"
     p2p_port = 8081  # Výchozí P2P port
     logger.info(f"Klient připojen: {address}")
-    
+
     try:
-        # Nastavení timeoutu pro připojení
-        client_socket.settimeout(CONNECTION_TIMEOUT)
-        
         # Přijetí uživatelského jména a P2P portu (volitelné)
         welcome_msg = receive_message(client_socket, timeout=10.0)
         if welcome_msg:
@@ -295,20 +503,26 @@ def handle_client(client_socket: socket.socket, address: Tuple[str, int]):
                         p2p_port = 8081
                 logger.info(f"Klient {address} nastavil jméno: {username}, P2P port: {p2p_port}")
         
-        # Přidání klienta do seznamu (thread-safe)
-        current_time = time.time()
+        # Přidání klienta do registru (thread-safe)
+        current_time = time.monotonic()
         with clients_lock:
             if len(clients) >= MAX_CLIENTS:
-                send_message(client_socket, "ERROR: Server je plný")
+                _send_frame(client_socket, _SERVER_FULL_FRAME)
+                _recv_buffers.pop(client_socket.fileno(), None)
                 client_socket.close()
                 return
-            
+
             # Přiřazení barvy uživateli (cyklicky z palety)
             user_color = get_user_color(len(clients))
             color_code = user_color.replace('\033[', '').replace('m', '')  # Extrahujeme číslo barvy
-            
-            # Přidání s heartbeat, rate limiting a barvou
-            clients.append((client_socket, address, username, p2p_port, current_time, current_time, 0, color_code))
+
+            # Přidání s heartbeat, rate limiting a barvou; konstantní
+            # části chatového řádku se kódují jednou na celou relaci
+            state = ClientState(client_socket, address, username, p2p_port,
+                                current_time, current_time, 0, color_code,
+                                f"[COLOR:{color_code}][".encode('utf-8'),
+                                f"] {username}: ".encode('utf-8'))
+            _register_client(state)
             logger.info(f"Celkem klientů: {len(clients)}, barva pro {username}: {color_code}")
         
         # Získání počtu připojených uživatelů
@@ -319,94 +533,385 @@ def handle_client(client_socket: socket.socket, address: Tuple[str, int]):
         send_message(client_socket, f"Vítejte v chatu, {username}! [{user_count} uživatel{'é' if user_count > 1 else ''} online] Napište zprávu a stiskněte Enter. Použijte /help pro nápovědu.")
         
         # Broadcast o novém připojení všem ostatním klientům
-        current_time = datetime.now().strftime("%H:%M")
         broadcast_message(f"Server: {username} se připojil k chatu", exclude_socket=client_socket)
-        
-        # Hlavní smyčka pro komunikaci s klientem
-        while server_running.is_set():
-            message = receive_message(client_socket)
-            
-            if not message:
-                # Klient se odpojil
-                break
-            
-            # Validace zprávy
-            if len(message.strip()) == 0:
+
+        # Předání socketu čtecímu vláknu - od teď už tohle vlákno
+        # klienta neobsluhuje a vrací se do fondu
+        _register_reader(state)
+
+    except socket.timeout:
+        logger.warning(f"Timeout pro klienta {address}")
+        _cleanup_handshake(client_socket, address)
+    except (ConnectionResetError, ConnectionAbortedError, OSError) as e:
+        # Klient ukončil spojení - to je normální
+        logger.info(f"Klient {address} ukončil spojení: {e}")
+        _cleanup_handshake(client_socket, address)
+    except Exception as e:
+        logger.error(f"Chyba při komunikaci s klientem {address}: {e}", exc_info=True)
+        _cleanup_handshake(client_socket, address)
+
+
+def _cleanup_handshake(client_socket: socket.socket, address: Tuple[str, int]):
+    """Úklid po klientovi, který selhal ještě během handshake"""
+    with clients_lock:
+        state = clients.get(client_socket.fileno())
+        if state is not None:
+            _unregister_client(state)
+        else:
+            _recv_buffers.pop(client_socket.fileno(), None)
+    try:
+        client_socket.close()
+    except:
+        pass
+
+
+def _register_reader(state: ClientState):
+    """
+    Zaregistruje socket klienta do čtecího selectoru
+
+    Args:
+        state: Stav klienta
+    """
+    state.sock.setblocking(False)
+    # Stav rámování příjmu plus odchozí fronta pro neblokující zápis
+    conn = {'state': state, 'got': 0,
+            'out': bytearray(), 'out_off': 0, 'dead': False}
+    _conns[state.sock.fileno()] = conn
+    _reader_selector.register(state.sock, selectors.EVENT_READ, conn)
+
+
+def reader_loop():
+    """
+    Čtecí vlákno - jedním selectorem multiplexuje všechny klienty
+
+    Dříve blokovalo jedno vlákno v recv pro každého klienta; teď spí
+    všichni nečinní klienti v jediném epoll čekání a vlákna fondu se
+    používají jen na handshake.
+    """
+    while server_running.is_set():
+        try:
+            events = _reader_selector.select(timeout=1.0)
+        except OSError:
+            # Selector zavřen při ukončování serveru
+            break
+        for key, mask in events:
+            if key.data is None:
+                # Probouzecí roura - jen vyprázdnit
+                try:
+                    os.read(_wakeup_r, 4096)
+                except OSError:
+                    pass
                 continue
-            
-            # Zpracování PONG odpovědi na heartbeat (před ostatními kontrolami)
-            if message == "PONG":
-                update_heartbeat(client_socket)
+            if key.data.get('listener'):
+                _accept_ready(key.fileobj)
                 continue
-            
-            # Kontrola rate limitingu (kromě systémových příkazů)
-            if not message.startswith("/"):
-                if not check_rate_limit(client_socket):
-                    send_message(client_socket, f"ERROR: Příliš mnoho zpráv! Maximálně {RATE_LIMIT_MESSAGES} zpráv za {RATE_LIMIT_WINDOW} sekund.")
-                    logger.warning(f"Rate limit překročen pro {username} ({address})")
-                    continue
-            
-            # Aktualizace heartbeat při jakékoli aktivitě
-            update_heartbeat(client_socket)
-            
-            logger.info(f"Přijato od {username} ({address}): {message}")
-            
-            # Speciální příkazy
-            if message.startswith("/"):
-                command = message.split()[0] if message.split() else message
-                
-                if command == "/quit":
-                    try:
-                        send_message(client_socket, "Odpojování...")
-                    except (ConnectionResetError, ConnectionAbortedError, OSError):
-                        # Klient už ukončil spojení - to je v pořádku
-                        pass
-                    break
-                elif command == "/list":
-                    with clients_lock:
-                        user_list = ", ".join([u for _, _, u, _, _, _, _, _ in clients])
-                    send_message(client_socket, f"Připojení uživatelé: {user_list}")
-                elif command == "/getpeer" and len(message.split()) >= 2:
-                    # Získání P2P informací o uživateli
-                    target_username = message.split()[1]
-                    with clients_lock:
-                        found = False
-                        for sock, (ip, port), uname, peer_port, _, _, _, _ in clients:
-                            if uname.lower() == target_username.lower():
-                                send_message(client_socket, f"PEER_INFO:{uname}:{ip}:{peer_port}")
-                                found = True
-                                break
-                        if not found:
-                            send_message(client_socket, f"ERROR: Uživatel '{target_username}' není připojen")
-                elif command == "/pm" and len(message.split()) >= 3:
-                    # Soukromá zpráva přes server (fallback, pokud P2P nefunguje)
-                    parts = message.split(" ", 2)
-                    target_username = parts[1]
-                    pm_message = parts[2] if len(parts) > 2 else ""
-                    
-                    with clients_lock:
-                        found = False
-                        for sock, addr, uname, _, _, _, _, _ in clients:
-                            if uname.lower() == target_username.lower():
-                                send_message(sock, f"[PM od {username}] {pm_message}")
-                                send_message(client_socket, f"INFO: Soukromá zpráva odeslána {uname}")
-                                found = True
-                                logger.info(f"Soukromá zpráva od {username} k {uname}: {pm_message}")
-                                break
-                        if not found:
-                            send_message(client_socket, f"ERROR: Uživatel '{target_username}' není připojen")
-                elif command == "/peers":
-                    # Seznam všech uživatelů s jejich P2P informacemi
-                    with clients_lock:
-                        peer_list = []
-                        for sock, (ip, port), uname, peer_port, _, _, _, _ in clients:
-                            peer_list.append(f"{uname} ({ip}:{peer_port})")
-                        send_message(client_socket, f"P2P informace:\n" + "\n".join(peer_list))
-                elif command == "/broadcast" and len(message.split()) > 1:
-                    # /broadcast je nyní zbytečný, protože všechny zprávy se automaticky broadcastují
-                    send_message(client_socket, "INFO: Všechny zprávy se automaticky posílají všem uživatelům. Stačí napsat zprávu.")
-                elif command == "/help":
-                    help_text = """=== Chat Server - Nápověda ===
+            if mask & selectors.EVENT_WRITE:
+                _write_ready(key.data)
+            if mask & selectors.EVENT_READ and not key.data['dead']:
+                _read_ready(key.data)
+        # Zapnutí EVENT_WRITE pro fronty naplněné jinými vlákny -
+        # selector smí upravovat jen tohle vlákno
+        _flush_pending()
+
+
+def _accept_ready(listener: socket.socket):
+    """
+    Přijme čekající klienty z naslouchacího socketu (volá čtecí vlákno)
+
+    Args:
+        listener: Neblokující naslouchací socket
+    """
+    while True:
+        try:
+            client, address = listener.accept()
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as e:
+            if server_running.is_set():
+                logger.error(f"Chyba při přijímání klienta: {e}")
+            return
+
+        # Vypnutí Nagleova algoritmu - chatové zprávy jsou malé
+        # a latence je důležitější než slučování segmentů
+        client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        # TCP_QUICKACK (Linux) - potlačí zpožděné ACK, které by
+        # u drobných chatových zpráv přidávaly až 40 ms latence.
+        # Jádro si příznak může po recv resetovat, ale i jedno
+        # nastavení pomáhá při navazování spojení
+        if hasattr(socket, 'TCP_QUICKACK'):
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_QUICKACK, 1)
+
+        # SO_KEEPALIVE - mrtvé spojení odhalí i TCP vrstva,
+        # nejen aplikační heartbeat
+        client.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+
+        # Pro jistotu i na přijatém socketu - dědění z listeneru
+        # není zaručené na všech platformách
+        tune_socket_buffers(client)
+
+        logger.info(f"Nové připojení z {address}")
+
+        # Handshake klienta běží v recyklovaném vlákně fondu
+        _executor.submit(handle_client, client, address)
+
+
+def _queue_frame(state: ClientState, frame: bytes) -> bool:
+    """
+    Zařadí rámec do odchozí fronty klienta (neblokující odeslání)
+
+    Samotný zápis do socketu provede čtecí vlákno, až bude socket
+    zapisovatelný - volající se nikdy nezablokuje na pomalém klientovi.
+
+    Args:
+        state: Stav klienta
+        frame: Hotový rámec z _build_frame
+
+    Returns:
+        False pokud fronta přerostla MAX_OUTBOUND nebo spojení
+        neexistuje - klienta je pak na místě odpojit
+    """
+    conn = _conns.get(state.sock.fileno())
+    if conn is None or conn['dead']:
+        # Socket ještě není u selectoru (probíhá handshake) - je stále
+        # blokující, přímé odeslání je v pořádku
+        return _send_frame(state.sock, frame)
+
+    with _out_lock:
+        conn['out'] += frame
+        backlog = len(conn['out']) - conn['out_off']
+
+    with _pending_lock:
+        _write_pending.append(state.sock.fileno())
+    if _wakeup_w >= 0:
+        try:
+            os.write(_wakeup_w, b'\0')
+        except (BlockingIOError, OSError):
+            pass  # Roura plná - selector se probudí i tak
+
+    return backlog <= MAX_OUTBOUND
+
+
+def _send_to_client(state: ClientState, message: str) -> bool:
+    """
+    Odešle zprávu klientovi přes jeho odchozí frontu
+
+    Po handshake je socket neblokující - přímý sendall/sendmsg může
+    na plném bufferu skončit částečným zápisem (utržený rámec) nebo
+    se proplést s broadcastem, který _write_ready zrovna rozepsala.
+    Všechna odesílání po handshake proto musí jít přes _queue_frame.
+
+    Args:
+        state: Stav klienta
+        message: Zpráva k odeslání
+
+    Returns:
+        Totéž co _queue_frame
+    """
+    return _queue_frame(state, _build_frame(message))
+
+
+def _flush_pending():
+    """Zapne EVENT_WRITE pro nahlášené fd (volá jen čtecí vlákno)"""
+    with _pending_lock:
+        if not _write_pending:
+            return
+        pending = _write_pending[:]
+        del _write_pending[:]
+
+    for fd in pending:
+        conn = _conns.get(fd)
+        if conn is None or conn['dead']:
+            continue
+        with _out_lock:
+            has_data = conn['out_off'] < len(conn['out'])
+        if has_data:
+            try:
+                _reader_selector.modify(
+                    conn['state'].sock,
+                    selectors.EVENT_READ | selectors.EVENT_WRITE, conn)
+            except (KeyError, ValueError, OSError):
+                pass
+
+
+def _write_ready(conn: dict):
+    """
+    Odešle, co socket pobere, z odchozí fronty (volá jen čtecí vlákno)
+
+    Args:
+        conn: Stav spojení s odchozí frontou
+    """
+    state = conn['state']
+    sock = state.sock
+    error = None
+    with _out_lock:
+        mv = memoryview(conn['out'])[conn['out_off']:]
+        try:
+            if mv:
+                n = sock.send(mv)
+                conn['out_off'] += n
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as e:
+            error = e
+        finally:
+            # memoryview nesmí přežít zámek - držela by bytearray
+            # a _queue_frame by ji nemohl zvětšit
+            mv.release()
+
+        if error is None and conn['out_off'] >= len(conn['out']):
+            # Fronta prázdná - vrátit se k čistému čtení
+            conn['out'] = bytearray()
+            conn['out_off'] = 0
+            try:
+                _reader_selector.modify(sock, selectors.EVENT_READ, conn)
+            except (KeyError, ValueError, OSError):
+                pass
+
+    # Odpojení až mimo zámek fronty - úklid sám posílá broadcast
+    if error is not None:
+        logger.info(f"Klient {state.addr} ukončil spojení: {error}")
+        _disconnect_client(state)
+
+
+def _read_ready(conn: dict):
+    """
+    Zpracuje připravená data jednoho klienta (volá jen čtecí vlákno)
+
+    Přečte ze socketu vše, co kernel nabízí, a zpracuje všechny úplné
+    rámce v bufferu naráz - při dávce zpráv (pipelining, rušný chat)
+    tak na rámec nepřipadá samostatný recv ani probuzení selectoru.
+
+    Args:
+        conn: Stav rámování se stavem klienta
+    """
+    state = conn['state']
+    sock = state.sock
+    fd = sock.fileno()
+    if fd < 0:
+        return
+    buf = _recv_buffers.get(fd)
+    if buf is None:
+        buf = _recv_buffers[fd] = bytearray(4 + _MAX_MESSAGE)
+    mv = memoryview(buf)
+
+    try:
+        n = sock.recv_into(mv[conn['got']:])
+    except (BlockingIOError, InterruptedError):
+        return
+    except OSError as e:
+        logger.info(f"Klient {state.addr} ukončil spojení: {e}")
+        _disconnect_client(state)
+        return
+
+    if n == 0:
+        # Protistrana zavřela spojení
+        _disconnect_client(state)
+        return
+
+    got = conn['got'] + n
+    offset = 0
+
+    while got - offset >= 4:
+        message_length = _HDR.unpack_from(buf, offset)[0]
+        if message_length > _MAX_MESSAGE:
+            logger.warning(f"Příliš dlouhá zpráva od {state.username}: {message_length} bytů")
+            _disconnect_client(state)
+            return
+        if got - offset < 4 + message_length:
+            break
+        payload = bytes(mv[offset + 4:offset + 4 + message_length])
+        offset += 4 + message_length
+        try:
+            # Čistý chat (nezačíná "/" a není PONG) se obslouží rovnou
+            # nad bytes - dekódování a zpětné kódování by bylo zbytečné
+            if payload and payload[0] != 0x2F and payload != b"PONG":
+                _process_chat_bytes(state, payload)
+            else:
+                process_message(state, payload.decode('utf-8', errors='replace'))
+        except Exception as e:
+            logger.error(f"Chyba při zpracování zprávy od {state.username}: {e}", exc_info=True)
+        if conn['dead']:
+            # Klient se během zpracování odpojil (/quit, backpressure)
+            return
+
+    # Posun nedokončeného zbytku na začátek bufferu; díky limitu
+    # _MAX_MESSAGE se největší rámec od začátku bufferu vždy vejde
+    if offset:
+        remaining = got - offset
+        if remaining:
+            # buf[offset:got] vytvoří kopii, takže překryv nevadí
+            buf[:remaining] = buf[offset:got]
+        got = remaining
+    conn['got'] = got
+
+
+def _drop_client(state: ClientState) -> bool:
+    """
+    Tichý úklid klienta: selector, fronty, registr, socket
+
+    Args:
+        state: Stav klienta
+
+    Returns:
+        True pokud byl klient ještě v registru
+    """
+    sock = state.sock
+    fd = sock.fileno()
+    conn = _conns.pop(fd, None)
+    if conn is not None:
+        conn['dead'] = True
+    try:
+        _reader_selector.unregister(sock)
+    except (KeyError, ValueError, OSError):
+        pass
+
+    # Best-effort doručení zbytku odchozí fronty (např. odpovědi
+    # "Odpojování..." na /quit) - krátce a blokovaně, ať úklid nevisí
+    # na klientovi, který nečte
+    if conn is not None:
+        with _out_lock:
+            remaining = bytes(conn['out'][conn['out_off']:])
+            conn['out'] = bytearray()
+            conn['out_off'] = 0
+        if remaining:
+            try:
+                sock.settimeout(0.5)
+                sock.sendall(remaining)
+            except OSError:
+                pass
+
+    was_registered = False
+    with clients_lock:
+        if clients.get(fd) is state:
+            _unregister_client(state)
+            was_registered = True
+
+    try:
+        sock.close()
+    except:
+        pass
+    return was_registered
+
+
+def _disconnect_client(state: ClientState):
+    """
+    Odpojí klienta a oznámí jeho odchod ostatním
+
+    Args:
+        state: Stav klienta
+    """
+    if _drop_client(state):
+        logger.info(f"Klient odpojen: {state.username} ({state.addr}). Celkem klientů: {len(clients)}")
+        try:
+            broadcast_message(f"[{_now_hhmm()}] Server: {state.username} opustil chat")
+        except:
+            pass
+
+
+_UNKNOWN_COMMAND = "ERROR: Neznámý příkaz. Použijte /help"
+
+_HELP_TEXT = """=== Chat Server - Nápověda ===
 Všechny vaše zprávy se automaticky posílají všem uživatelům v chatu.
 
 Dostupné příkazy:
@@ -423,72 +928,206 @@ Pro soukromé zprávy:
 3. Nebo použijte /pm <uživatel> <zpráva> pro soukromou zprávu přes server
 
 Pro odeslání zprávy jednoduše napište text a stiskněte Enter."""
-                    send_message(client_socket, help_text)
-                else:
-                    send_message(client_socket, f"ERROR: Neznámý příkaz. Použijte /help")
-            else:
-                # Chat zpráva - broadcast všem klientům (včetně odesílatele, aby viděl svou zprávu)
-                current_time = datetime.now().strftime("%H:%M")
-                
-                # Získání barvy uživatele
-                user_color_code = "37"  # Výchozí bílá
-                with clients_lock:
-                    for sock, _, uname, _, _, _, _, color in clients:
-                        if sock == client_socket:
-                            user_color_code = color
-                            break
-                
-                # Přidání informace o barvě do zprávy
-                chat_message = f"[COLOR:{user_color_code}][{current_time}] {username}: {message}"
-                logger.info(f"Chat zpráva od {username}: {message}")
-                
-                # Broadcast všem klientům (včetně odesílatele)
-                try:
-                    broadcast_message(chat_message)  # Bez exclude_socket, takže všichni včetně odesílatele dostanou zprávu
-                except Exception as e:
-                    logger.error(f"Chyba při broadcastu: {e}")
-    
-    except socket.timeout:
-        logger.warning(f"Timeout pro klienta {address}")
-    except (ConnectionResetError, ConnectionAbortedError, OSError) as e:
-        # Klient ukončil spojení - to je normální
-        logger.info(f"Klient {address} ukončil spojení: {e}")
+
+# Neměnné odpovědi se rámují jednou při startu místo kódování
+# a balení délky při každém odeslání
+_HELP_FRAME = _build_frame(_HELP_TEXT)
+_UNKNOWN_COMMAND_FRAME = _build_frame(_UNKNOWN_COMMAND)
+_RATE_LIMIT_FRAME = _build_frame(
+    f"ERROR: Příliš mnoho zpráv! Maximálně {RATE_LIMIT_MESSAGES} zpráv za {RATE_LIMIT_WINDOW} sekund.")
+_SERVER_FULL_FRAME = _build_frame("ERROR: Server je plný")
+_PING_FRAME = _build_frame("PING")
+
+
+def _cmd_quit(state: ClientState, parts: list, message: str):
+    """Příkaz /quit - odpojení klienta"""
+    # Odpověď se zařadí do fronty a doručí ji závěrečný doflush
+    # v _drop_client těsně před zavřením socketu
+    _send_to_client(state, "Odpojování...")
+    _disconnect_client(state)
+
+
+def _cmd_list(state: ClientState, parts: list, message: str):
+    """Příkaz /list - seznam připojených uživatelů"""
+    # Zámek kryje jen opsání jmen; spojování řetězce běží bez zámku,
+    # aby dlouhý seznam nebrzdil registrace a broadcasty
+    with clients_lock:
+        names = [st.username for st in clients.values()]
+    _send_to_client(state, "Připojení uživatelé: " + ", ".join(names))
+
+
+def _cmd_getpeer(state: ClientState, parts: list, message: str):
+    """Příkaz /getpeer - P2P informace o uživateli, O(1) přes jmenný index"""
+    if len(parts) < 2:
+        _queue_frame(state, _UNKNOWN_COMMAND_FRAME)
+        return
+    target_username = parts[1]
+    # Čtení ze slovníku je pod GIL atomické - zámek kryje jen mutace
+    # indexu při registraci/odregistraci
+    target = clients_by_name.get(target_username.lower())
+    if target is not None:
+        _send_to_client(state, f"PEER_INFO:{target.username}:{target.addr[0]}:{target.p2p_port}")
+    else:
+        _send_to_client(state, f"ERROR: Uživatel '{target_username}' není připojen")
+
+
+def _cmd_pm(state: ClientState, parts: list, message: str):
+    """Příkaz /pm - soukromá zpráva přes server (fallback, pokud P2P nefunguje)"""
+    if len(parts) < 3:
+        _queue_frame(state, _UNKNOWN_COMMAND_FRAME)
+        return
+    # Jediný další split kvůli zachování mezer ve zprávě
+    _, target_username, pm_message = message.split(" ", 2)
+    # Atomické čtení bez zámku, stejně jako v /getpeer
+    target = clients_by_name.get(target_username.lower())
+    if target is not None:
+        _queue_frame(target, _build_frame(f"[PM od {state.username}] {pm_message}"))
+        _send_to_client(state, f"INFO: Soukromá zpráva odeslána {target.username}")
+        logger.info(f"Soukromá zpráva od {state.username} k {target.username}: {pm_message}")
+    else:
+        _send_to_client(state, f"ERROR: Uživatel '{target_username}' není připojen")
+
+
+def _cmd_peers(state: ClientState, parts: list, message: str):
+    """Příkaz /peers - seznam všech uživatelů s P2P informacemi"""
+    # Stejně jako /list: pod zámkem jen snapshot, formátování bez něj
+    with clients_lock:
+        peers = [(st.username, st.addr[0], st.p2p_port) for st in clients.values()]
+    peer_list = [f"{name} ({host}:{port})" for name, host, port in peers]
+    _send_to_client(state, "P2P informace:\n" + "\n".join(peer_list))
+
+
+def _cmd_broadcast(state: ClientState, parts: list, message: str):
+    """Příkaz /broadcast - už není potřeba, zprávy se broadcastují automaticky"""
+    if len(parts) < 2:
+        _queue_frame(state, _UNKNOWN_COMMAND_FRAME)
+        return
+    _send_to_client(state, "INFO: Všechny zprávy se automaticky posílají všem uživatelům. Stačí napsat zprávu.")
+
+
+def _cmd_help(state: ClientState, parts: list, message: str):
+    """Příkaz /help - nápověda"""
+    _queue_frame(state, _HELP_FRAME)
+
+
+# Dispatch tabulka příkazů - O(1) výběr obsluhy místo řetězu elif
+COMMANDS = {
+    "/quit": _cmd_quit,
+    "/list": _cmd_list,
+    "/getpeer": _cmd_getpeer,
+    "/pm": _cmd_pm,
+    "/peers": _cmd_peers,
+    "/broadcast": _cmd_broadcast,
+    "/help": _cmd_help,
+}
+
+
+def _process_chat_bytes(state: ClientState, payload: bytes):
+    """
+    Horká cesta čisté chatové zprávy - tělo zůstává jako bytes
+
+    Příkazy a PONG vyžadují text, ale běžná chatová zpráva se jen
+    obalí předkódovaným prefixem a rozešle; dekódovat a znovu kódovat
+    UTF-8 by u ní bylo zbytečné. Dekóduje se jedině pro log, a to jen
+    pokud je INFO úroveň zapnutá.
+
+    Args:
+        state: Stav klienta odesílatele
+        payload: Tělo zprávy přesně tak, jak přišlo ze sítě
+    """
+    # Validace zprávy
+    if not payload.strip():
+        return
+
+    if not touch_and_check_rate_limit(state):
+        _queue_frame(state, _RATE_LIMIT_FRAME)
+        logger.warning(f"Rate limit překročen pro {state.username} ({state.addr})")
+        return
+
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(f"Chat zpráva od {state.username}: {payload.decode('utf-8', errors='replace')}")
+
+    # Broadcast všem klientům (včetně odesílatele, aby viděl svou zprávu)
+    try:
+        _broadcast_payload(state.chat_pre + _now_hhmm_bytes() + state.chat_sep + payload)
     except Exception as e:
-        logger.error(f"Chyba při komunikaci s klientem {address}: {e}", exc_info=True)
-    
-    finally:
-        # Odstranění klienta ze seznamu (thread-safe)
-        with clients_lock:
-            clients_to_remove = [c for c in clients if c[0] == client_socket]
-            for client_info in clients_to_remove:
-                clients.remove(client_info)
-                logger.info(f"Klient odpojen: {client_info[2]} ({address}). Celkem klientů: {len(clients)}")
-        
-        # Broadcast o odpojení všem ostatním klientům
-        try:
-            current_time = datetime.now().strftime("%H:%M")
-            broadcast_message(f"[{current_time}] Server: {username} opustil chat")
-        except:
-            pass
-        
-        # Uzavření socketu
+        logger.error(f"Chyba při broadcastu: {e}")
+
+
+def process_message(state: ClientState, message: str):
+    """
+    Zpracování jedné kompletní zprávy od klienta
+
+    Args:
+        state: Stav klienta
+        message: Přijatá zpráva
+    """
+    client_socket = state.sock
+    username = state.username
+    address = state.addr
+
+    # Validace zprávy
+    if len(message.strip()) == 0:
+        return
+
+    # Zpracování PONG odpovědi na heartbeat (před ostatními kontrolami)
+    if message == "PONG":
+        update_heartbeat(state)
+        return
+
+    # Heartbeat a rate limit jedním dotykem; příkazy limitu nepodléhají,
+    # takže u nich stačí aktualizovat heartbeat
+    if message.startswith("/"):
+        update_heartbeat(state)
+    elif not touch_and_check_rate_limit(state):
+        _queue_frame(state, _RATE_LIMIT_FRAME)
+        logger.warning(f"Rate limit překročen pro {username} ({address})")
+        return
+
+    logger.info(f"Přijato od {username} ({address}): {message}")
+
+    # Speciální příkazy - jeden split a výběr obsluhy z tabulky
+    if message.startswith("/"):
+        parts = message.split()
+        command = parts[0] if parts else message
+
+        handler = COMMANDS.get(command)
+        if handler is not None:
+            handler(state, parts, message)
+        else:
+            _queue_frame(state, _UNKNOWN_COMMAND_FRAME)
+    else:
+        # Chat zpráva - broadcast všem klientům (včetně odesílatele, aby viděl svou zprávu)
+        # Barva i jméno jsou zakódované předem, za běhu se kóduje jen
+        # text zprávy: "[COLOR:c][HH:MM] jmeno: zprava"
+        payload = state.chat_pre + _now_hhmm_bytes() + state.chat_sep + message.encode('utf-8')
+        logger.info(f"Chat zpráva od {username}: {message}")
+
+        # Broadcast všem klientům (včetně odesílatele)
         try:
-            client_socket.close()
-        except:
-            pass
+            _broadcast_payload(payload)  # Bez exclude_socket, takže všichni včetně odesílatele dostanou zprávu
+        except Exception as e:
+            logger.error(f"Chyba při broadcastu: {e}")
 
 
 def main():
     """
     Hlavní funkce serveru
     """
-    global server_running
-    
+    global server_running, _reader_selector, _wakeup_r, _wakeup_w, _executor
+
     logger.info("=" * 50)
     logger.info("Spouštění Chat Serveru")
     logger.info("=" * 50)
-    
+
     server = None
+    executor = None
+    _reader_selector = selectors.DefaultSelector()
+    # Roura, kterou ostatní vlákna budí selector po zápisu do front
+    _wakeup_r, _wakeup_w = os.pipe()
+    os.set_blocking(_wakeup_r, False)
+    os.set_blocking(_wakeup_w, False)
+    _reader_selector.register(_wakeup_r, selectors.EVENT_READ, None)
     try:
         # Vytvoření socketu
         # AF_INET = IPv4, SOCK_STREAM = TCP
@@ -496,7 +1135,16 @@ def main():
         
         # Nastavení socketu pro opakované použití adresy
         server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        
+
+        # SO_REUSEPORT (kde je k dispozici) - na stejném portu může
+        # naslouchat více procesů serveru a kernel mezi ně rozkládá
+        # příchozí spojení bez zámku v userspace
+        if hasattr(socket, 'SO_REUSEPORT'):
+            server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+
+        # Větší buffery na naslouchacím socketu - přijaté sockety je dědí
+        tune_socket_buffers(server)
+
         # Navázání socketu na adresu a port
         server.bind((DEFAULT_HOST, DEFAULT_PORT))
         
@@ -509,7 +1157,16 @@ def main():
         logger.info(f"Rate limit: {RATE_LIMIT_MESSAGES} zpráv za {RATE_LIMIT_WINDOW}s")
         logger.info("Stiskněte Ctrl+C pro ukončení")
         
-        # Spuštění heartbeat monitor thread
+        # Omezený fond vláken - vlákna se recyklují mezi krátkými
+        # spojeními místo pthread_create/destroy pro každého klienta
+        executor = ThreadPoolExecutor(
+            max_workers=MAX_CLIENTS,
+            thread_name_prefix="ClientHandler"
+        )
+        _executor = executor
+
+        # Heartbeat monitor zůstává daemon vlákno mimo fond - spí až
+        # HEARTBEAT_INTERVAL v kuse a ve fondu by blokoval ukončení
         heartbeat_thread = threading.Thread(
             target=heartbeat_monitor,
             daemon=True,
@@ -517,32 +1174,25 @@ def main():
         )
         heartbeat_thread.start()
         logger.info("Heartbeat monitor spuštěn")
-        
-        # Hlavní smyčka - přijímání nových klientů
+
+        # Jedno čtecí vlákno pro všechny klienty
+        reader_thread = threading.Thread(
+            target=reader_loop,
+            daemon=True,
+            name="ClientReader"
+        )
+        reader_thread.start()
+        logger.info("Čtecí vlákno spuštěno")
+
+        # I accept jde přes selector - naslouchací socket je neblokující
+        # a nová spojení přijímá čtecí vlákno spolu s daty klientů
+        server.setblocking(False)
+        _reader_selector.register(server, selectors.EVENT_READ, {'listener': True})
+
+        # Hlavní vlákno už jen čeká na Ctrl+C
         while server_running.is_set():
-            try:
-                # Přijetí nového klienta
-                client, address = server.accept()
-                
-                logger.info(f"Nové připojení z {address}")
-                
-                # Vytvoření nového vlákna pro obsluhu klienta
-                # daemon=True = vlákno se ukončí s hlavním programem
-                thread = threading.Thread(
-                    target=handle_client,
-                    args=(client, address),
-                    daemon=True,
-                    name=f"ClientHandler-{address[1]}"
-                )
-                thread.start()
-                
-            except OSError as e:
-                if server_running.is_set():
-                    logger.error(f"Chyba při přijímání klienta: {e}")
-                break
-            except Exception as e:
-                logger.error(f"Neočekávaná chyba: {e}", exc_info=True)
-    
+            time.sleep(0.5)
+
     except KeyboardInterrupt:
         logger.info("\nUkončování serveru...")
     except Exception as e:
@@ -551,17 +1201,46 @@ def main():
         # Graceful shutdown
         server_running.clear()
         
-        # Uzavření všech připojení
+        # Uzavření všech připojení - rámec rozlučky se postaví jednou
+        # a každému klientovi odejde jedním sendmsg před zavřením
         logger.info("Uzavírání připojení klientů...")
+        goodbye = "Server se ukončuje...".encode('utf-8')
+        goodbye_frame = _HDR.pack(len(goodbye)) + goodbye
         with clients_lock:
-            for client_sock, address, username, p2p_port, _, _, _ in clients[:]:
+            for state in list(clients.values()):
+                # sendall nad hotovým rámcem je jediný syscall a na
+                # rozdíl od sendmsg existuje i na Windows; krátký
+                # timeout, ať vypnutí nevisí na klientovi, který nečte
                 try:
-                    send_message(client_sock, "Server se ukončuje...")
-                    client_sock.close()
+                    state.sock.settimeout(0.5)
+                    state.sock.sendall(goodbye_frame)
+                except OSError:
+                    pass
+                # close zvlášť - neúspěšná rozlučka nesmí nechat socket otevřený
+                try:
+                    state.sock.close()
                 except:
                     pass
             clients.clear()
-        
+            clients_by_name.clear()
+
+        # Ukončení fondu - na obslužná vlákna se nečeká, uzavřené
+        # sockety je probudí a doběhnou sama
+        if executor:
+            executor.shutdown(wait=False)
+
+        # Uzavření selectoru čtecího vlákna a probouzecí roury
+        try:
+            _reader_selector.close()
+        except:
+            pass
+        for fd in (_wakeup_r, _wakeup_w):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        _wakeup_r = _wakeup_w = -1
+
         # Uzavření serveru
         if server:
             try: